@@ -0,0 +1,25 @@
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from .cache import token_cache
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication, который берёт пользователя из кэша токенов
+    и обращается к таблице токенов только при промахе.
+    Записи удаляются обработчиками сигналов при удалении токена
+    (в том числе при выходе через djoser) и при изменении пользователя.
+    """
+
+    def authenticate_credentials(self, key):
+        user = token_cache.get(key)
+        if user is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, user)
+            return user, token
+        if not user.is_active:
+            raise AuthenticationFailed('Пользователь неактивен или удалён.')
+        token = self.get_model()(key=key, user=user)
+        token._state.adding = False
+        return user, token
@@ -0,0 +1,297 @@
+"""
+Бенчмарк эндпоинтов API на синтетическом наборе данных.
+Запросы выполняются внутри процесса тестовым клиентом Django,
+для каждого эндпоинта замеряются перцентили времени ответа
+и количество SQL-запросов.
+"""
+from collections import namedtuple
+from contextlib import contextmanager
+from math import ceil
+from statistics import mean
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from recipes.models import Ingredient, Recipe, Tag
+
+from .fast_serializers import FastRecipeSerializer, FastUserSubscribeSerializer
+from .serializers import RecipeSerializer, UserSubscribeSerializer
+from .services import prefetch_recent_recipes
+from .views import RecipeViewSet
+
+User = get_user_model()
+
+# Запросы, выполняемые за один замер: (метод, путь).
+# В путях подставляются значения из get_context().
+Scenario = namedtuple('Scenario', 'name requests anonymous')
+
+SCENARIOS = (
+    Scenario('recipes_list', (
+        ('GET', '/api/recipes/?limit=6'),
+    ), False),
+    Scenario('recipes_list_anonymous', (
+        ('GET', '/api/recipes/?limit=6'),
+    ), True),
+    Scenario('recipes_list_filtered', (
+        ('GET', '/api/recipes/?tags={tag}&tags={other_tag}'
+                '&is_favorited=1&limit=6'),
+    ), False),
+    Scenario('recipes_list_author', (
+        ('GET', '/api/recipes/?author={author}&limit=6'),
+    ), False),
+    Scenario('recipes_list_keyset', (
+        ('GET', '/api/recipes/?cursor=&limit=6'),
+    ), False),
+    Scenario('recipe_detail', (
+        ('GET', '/api/recipes/{recipe}/'),
+    ), False),
+    Scenario('ingredients_search', (
+        ('GET', '/api/ingredients/?name={ingredient_prefix}'),
+    ), False),
+    Scenario('subscriptions', (
+        ('GET', '/api/users/subscriptions/?limit=6&recipes_limit=3'),
+    ), False),
+    Scenario('feed', (
+        ('GET', '/api/recipes/feed/?limit=6'),
+    ), False),
+    Scenario('favorite_toggle', (
+        ('POST', '/api/recipes/{recipe}/favorite/'),
+        ('DELETE', '/api/recipes/{recipe}/favorite/'),
+    ), False),
+    Scenario('shopping_cart_toggle', (
+        ('POST', '/api/recipes/{recipe}/shopping_cart/'),
+        ('DELETE', '/api/recipes/{recipe}/shopping_cart/'),
+    ), False),
+    Scenario('subscribe_toggle', (
+        ('POST', '/api/users/{author}/subscribe/'),
+        ('DELETE', '/api/users/{author}/subscribe/'),
+    ), False),
+    Scenario('shopping_cart_download', (
+        ('GET', '/api/recipes/download_shopping_cart/'),
+    ), False),
+)
+PERCENTILES = (50, 90, 99)
+
+
+def get_percentile(values, percentile):
+    """
+    Перцентиль по методу ближайшего ранга.
+    """
+    values = sorted(values)
+    return values[max(0, ceil(percentile / 100 * len(values)) - 1)]
+
+
+@contextmanager
+def test_database(verbosity=0):
+    """
+    Создаёт пустую тестовую БД на время блока, как при запуске тестов.
+    """
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(
+        verbosity=verbosity, autoclobber=True, serialize=False
+    )
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+def get_context():
+    """
+    Выбирает пользователя, от имени которого выполняются запросы,
+    и объекты для подстановки в пути.
+    Пользователь - с наибольшим количеством подписок и непустым
+    списком покупок; рецепт и автор для переключателей - те,
+    с которыми у него ещё нет связей.
+    """
+    user = User.objects.filter(
+        shopping_list__isnull=False
+    ).annotate(
+        follows=Count('follow', distinct=True)
+    ).order_by('-follows', 'id').first()
+    if user is None:
+        raise ValueError('В БД нет пользователей со списком покупок.')
+    recipe = Recipe.objects.exclude(
+        is_favorite=user
+    ).exclude(
+        is_in_shopping_list=user
+    ).order_by('-favorites_count', 'id').first()
+    author = User.objects.exclude(
+        id=user.id
+    ).exclude(
+        followers=user
+    ).order_by('-followers_count', 'id').first()
+    tags = list(Tag.objects.order_by('id'))
+    ingredient = Ingredient.objects.order_by('id').first()
+    return user, {
+        'user': user.id,
+        'recipe': recipe.id,
+        'author': author.id,
+        'tag': tags[0].slug,
+        'other_tag': tags[-1].slug,
+        'tag_id': tags[0].id,
+        'ingredient': ingredient.id,
+        'ingredient_prefix': ingredient.name[:3],
+    }
+
+
+def measure_scenario(client, requests, iterations, warmup):
+    """
+    Выполняет запросы сценария warmup + iterations раз.
+    Возвращает время замеров в мс, количество SQL-запросов
+    последнего замера и статусы ответов.
+    """
+    timings = []
+    for iteration in range(warmup + iterations):
+        with CaptureQueriesContext(connection) as queries:
+            started = perf_counter()
+            statuses = []
+            for method, path in requests:
+                response = getattr(client, method.lower())(path)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                statuses.append(response.status_code)
+            elapsed = perf_counter() - started
+        if iteration >= warmup:
+            timings.append(elapsed * 1000)
+    return timings, len(queries), statuses
+
+
+def run_benchmark(iterations, warmup, scenarios=SCENARIOS):
+    """
+    Выполняет сценарии и возвращает результаты по эндпоинтам.
+    """
+    user, context = get_context()
+    token, _ = Token.objects.get_or_create(user=user)
+    results = {}
+    for scenario in scenarios:
+        client = APIClient()
+        if not scenario.anonymous:
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        requests = [
+            (method, path.format(**context))
+            for method, path in scenario.requests
+        ]
+        timings, queries, statuses = measure_scenario(
+            client, requests, iterations, warmup
+        )
+        result = {
+            f'p{percentile}_ms': round(get_percentile(timings, percentile), 3)
+            for percentile in PERCENTILES
+        }
+        result['mean_ms'] = round(mean(timings), 3)
+        result['queries'] = queries
+        result['statuses'] = statuses
+        results[scenario.name] = result
+    return results
+
+
+def compare(results, baseline, tolerance, min_delta_ms=0.5):
+    """
+    Сравнивает результаты с базовыми и возвращает список регрессий:
+    рост количества SQL-запросов, изменение статусов ответов и рост
+    p50 или p90 больше чем в (1 + tolerance) раз (и больше чем
+    на min_delta_ms, чтобы не учитывать шум на быстрых эндпоинтах).
+    """
+    regressions = []
+    for name, base in baseline.items():
+        current = results.get(name)
+        if current is None:
+            continue
+        if current['statuses'] != base['statuses']:
+            regressions.append(
+                f'{name}: статусы {base["statuses"]} -> '
+                f'{current["statuses"]}'
+            )
+        if current['queries'] > base['queries']:
+            regressions.append(
+                f'{name}: SQL-запросов {base["queries"]} -> '
+                f'{current["queries"]}'
+            )
+        for metric in ('p50_ms', 'p90_ms'):
+            limit = max(base[metric] * (1 + tolerance),
+                        base[metric] + min_delta_ms)
+            if current[metric] > limit:
+                regressions.append(
+                    f'{name}: {metric} {base[metric]:.2f} -> '
+                    f'{current[metric]:.2f}'
+                )
+    return regressions
+
+
+def get_serializer_cases(size):
+    """
+    Возвращает наборы объектов для сравнения сериализаторов:
+    {имя: (сериализатор, быстрый сериализатор, объекты, запрос)}.
+    Объекты загружаются так же, как в RecipeViewSet
+    и UserViewSet.subscriptions, сериализуется одна страница.
+    """
+    user, _ = get_context()
+    cases = {}
+    for name, request_user in (('recipes', user), ('recipes_anonymous', None)):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = request_user or AnonymousUser()
+        view = RecipeViewSet(
+            request=request, action='list', format_kwarg=None, kwargs={}
+        )
+        recipes = list(view.get_queryset()[:size])
+        cases[name] = (RecipeSerializer, FastRecipeSerializer, recipes,
+                       request)
+
+    request = Request(APIRequestFactory().get('/api/users/subscriptions/'))
+    request.user = user
+    authors = list(user.follow.all()[:size])
+    prefetch_recent_recipes(authors, 3)
+    cases['subscriptions'] = (
+        UserSubscribeSerializer, FastUserSubscribeSerializer, authors, request
+    )
+    return cases
+
+
+def measure_serializer(serializer_class, objects, request, iterations):
+    """
+    Время сериализации objects в мс за каждый из iterations замеров
+    и результат последнего замера в JSON.
+    """
+    timings = []
+    for _ in range(iterations):
+        started = perf_counter()
+        data = serializer_class(
+            objects, many=True, context={'request': request}
+        ).data
+        timings.append((perf_counter() - started) * 1000)
+    return timings, JSONRenderer().render(data)
+
+
+def benchmark_serializers(iterations, size):
+    """
+    Сравнивает время сериализации одной страницы сериализаторами
+    ModelSerializer и быстрыми сериализаторами.
+    Без SQL-запросов: все связи загружены заранее.
+    """
+    results = {}
+    for name, (serializer_class, fast_serializer_class, objects,
+               request) in get_serializer_cases(size).items():
+        with CaptureQueriesContext(connection) as queries:
+            timings, content = measure_serializer(
+                serializer_class, objects, request, iterations
+            )
+            fast_timings, fast_content = measure_serializer(
+                fast_serializer_class, objects, request, iterations
+            )
+        results[name] = {
+            'objects': len(objects),
+            'p50_ms': round(get_percentile(timings, 50), 3),
+            'fast_p50_ms': round(get_percentile(fast_timings, 50), 3),
+            'queries': len(queries),
+            'equal': content == fast_content,
+        }
+    return results
@@ -0,0 +1,264 @@
+"""
+Кэш ответов на анонимные запросы чтения и кэш токенов аутентификации.
+"""
+import pickle
+from collections import Counter, OrderedDict
+from hashlib import md5, sha256
+from threading import Lock
+from time import monotonic, time_ns
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+KEY_PREFIX = 'response-cache'
+TOKEN_KEY_PREFIX = 'auth-token'
+
+
+def increment(cache, key, delta=1):
+    """
+    Увеличивает счётчик key в кэше cache, создавая его при отсутствии.
+    """
+    if not cache.add(key, delta, timeout=None):
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            pass
+
+
+class ResponseCache:
+    """
+    Хранит данные ответов в кэше Django под ключом из имени представления,
+    нормализованных параметров запроса и версий моделей, от которых
+    зависит ответ. При изменении модели её версия увеличивается,
+    и старые записи перестают использоваться, а затем вытесняются
+    самим кэшем (LocMemCache, memcached и Redis вытесняют по LRU).
+    """
+
+    def __init__(self, alias, timeout):
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get_versions(self, models):
+        """
+        Возвращает строку с текущими версиями моделей models.
+        Отсутствующая (в том числе вытесненная) версия заменяется новой,
+        которая не совпадёт ни с одной из прежних.
+        """
+        keys = [self._version_key(model) for model in models]
+        versions = self.cache.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                versions[key] = time_ns()
+                self.cache.add(key, versions[key], timeout=None)
+        return '.'.join(str(versions[key]) for key in keys)
+
+    def bump(self, model):
+        """
+        Увеличивает версию модели model сразу и ещё раз после фиксации
+        транзакции, чтобы не осталось записей, закэшированных
+        по данным до фиксации.
+        """
+        self._bump(model)
+        transaction.on_commit(lambda: self._bump(model))
+
+    def make_key(self, view, request, models):
+        """
+        Ключ записи для запроса request к представлению view.
+        Параметры запроса сортируются, порядок значений не учитывается.
+        Хост входит в ключ, так как ссылки пагинации абсолютные.
+        """
+        params = sorted(
+            (name, sorted(values))
+            for name, values in request.query_params.lists()
+        )
+        digest = md5(repr(
+            (request.get_host(), sorted(view.kwargs.items()), params)
+        ).encode()).hexdigest()
+        return (
+            f'{KEY_PREFIX}:{view.basename}:{view.action}:'
+            f'{self.get_versions(models)}:{digest}'
+        )
+
+    def get(self, key):
+        data = self.cache.get(key)
+        self._count('hits' if data is not None else 'misses')
+        return data
+
+    def set(self, key, data):
+        self.cache.set(key, data, timeout=self.timeout)
+
+    def get_stats(self):
+        """
+        Возвращает счётчики попаданий и промахов.
+        """
+        stats = self.cache.get_many(
+            [f'{KEY_PREFIX}:hits', f'{KEY_PREFIX}:misses']
+        )
+        return {
+            'hits': stats.get(f'{KEY_PREFIX}:hits', 0),
+            'misses': stats.get(f'{KEY_PREFIX}:misses', 0),
+        }
+
+    def reset_stats(self):
+        self.cache.delete_many(
+            [f'{KEY_PREFIX}:hits', f'{KEY_PREFIX}:misses']
+        )
+
+    def _bump(self, model):
+        key = self._version_key(model)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, time_ns(), timeout=None)
+
+    def _count(self, name):
+        increment(self.cache, f'{KEY_PREFIX}:{name}')
+
+    def _version_key(self, model):
+        return f'{KEY_PREFIX}:version:{model._meta.label_lower}'
+
+
+response_cache = ResponseCache(
+    settings.RESPONSE_CACHE_ALIAS, settings.RESPONSE_CACHE_TIMEOUT
+)
+
+
+class TokenCache:
+    """
+    Кэш пользователей по ключу токена в два уровня:
+    - LRU-словарь процесса на local_size записей с временем жизни
+      local_ttl секунд, попадание в него не обращается ни к БД,
+      ни к кэшу Django;
+    - общий для процессов кэш Django на timeout секунд, только при
+      shared = True. Кэш, который у каждого процесса свой (LocMemCache),
+      не используется: удаление записи в одном процессе не видно
+      в остальных.
+    При выходе, смене пароля или деактивации записи удаляются из общего
+    кэша и из LRU текущего процесса, в остальных процессах они
+    устаревают не позже чем через local_ttl секунд.
+    Ключи хранятся в виде хэша, пользователь - сериализованным, чтобы
+    запросы не делили один экземпляр.
+    Счётчики копятся в процессе и сбрасываются в общий кэш пачками.
+    """
+    STATS = ('local_hits', 'shared_hits', 'misses')
+    STATS_FLUSH_EVERY = 100
+
+    def __init__(self, alias, timeout, local_size, local_ttl, shared):
+        self.alias = alias
+        self.timeout = timeout
+        self.local_size = local_size
+        self.local_ttl = local_ttl
+        self.shared = shared
+        self._local = OrderedDict()
+        self._lock = Lock()
+        self._stats = Counter()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, token_key):
+        """
+        Возвращает пользователя по ключу токена или None.
+        """
+        key = self._key(token_key)
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None and entry[0] > monotonic():
+                self._local.move_to_end(key)
+                data = entry[1]
+            else:
+                data = None
+        if data is not None:
+            self._count('local_hits')
+            return pickle.loads(data)
+        if self.shared:
+            data = self.cache.get(key)
+        if data is None:
+            self._count('misses')
+            return None
+        self._count('shared_hits')
+        self._remember(key, data)
+        return pickle.loads(data)
+
+    def set(self, token_key, user):
+        key = self._key(token_key)
+        data = pickle.dumps(user)
+        if self.shared:
+            self.cache.set(key, data, timeout=self.timeout)
+        self._remember(key, data)
+
+    def delete(self, tokens_keys):
+        """
+        Удаляет записи токенов сразу и ещё раз после фиксации
+        транзакции, чтобы запрос, прочитавший старые данные
+        до фиксации, не вернул их в кэш надолго.
+        """
+        keys = [self._key(token_key) for token_key in tokens_keys]
+        if not keys:
+            return
+        self._forget(keys)
+        transaction.on_commit(lambda: self._forget(keys))
+
+    def get_stats(self):
+        """
+        Возвращает счётчики попаданий и промахов всех процессов.
+        """
+        with self._lock:
+            stats, self._stats = self._stats, Counter()
+        self._flush_stats(stats)
+        keys = [f'{TOKEN_KEY_PREFIX}:{name}' for name in self.STATS]
+        stats = self.cache.get_many(keys)
+        return {
+            name: stats.get(key, 0) for name, key in zip(self.STATS, keys)
+        }
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+        self.cache.delete_many(
+            [f'{TOKEN_KEY_PREFIX}:{name}' for name in self.STATS]
+        )
+
+    def _remember(self, key, data):
+        with self._lock:
+            self._local[key] = (monotonic() + self.local_ttl, data)
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    def _forget(self, keys):
+        if self.shared:
+            self.cache.delete_many(keys)
+        with self._lock:
+            for key in keys:
+                self._local.pop(key, None)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+            if sum(self._stats.values()) < self.STATS_FLUSH_EVERY:
+                return
+            stats, self._stats = self._stats, Counter()
+        self._flush_stats(stats)
+
+    def _flush_stats(self, stats):
+        for name, value in stats.items():
+            increment(self.cache, f'{TOKEN_KEY_PREFIX}:{name}', value)
+
+    def _key(self, token_key):
+        return f'{TOKEN_KEY_PREFIX}:{sha256(token_key.encode()).hexdigest()}'
+
+
+token_cache = TokenCache(
+    settings.AUTH_TOKEN_CACHE_ALIAS,
+    settings.AUTH_TOKEN_CACHE_TIMEOUT,
+    settings.AUTH_TOKEN_LOCAL_CACHE_SIZE,
+    settings.AUTH_TOKEN_LOCAL_CACHE_TTL,
+    settings.CACHE_IS_SHARED,
+)
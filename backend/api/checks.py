@@ -0,0 +1,102 @@
+"""
+Системные проверки приложения api.
+"""
+from django.core.checks import Error, register
+from django.http import HttpRequest
+from rest_framework.request import Request
+
+from recipes.models import Ingredient, IngredientAmount, Recipe, Tag
+from users.models import User
+
+from .fast_serializers import FastRecipeSerializer, FastUserSubscribeSerializer
+from .serializers import (RecipeSerializer, ShortRecipeSerializer,
+                          UserSubscribeSerializer)
+
+
+def get_readable_fields(serializer):
+    """
+    Имена выводимых полей сериализатора в порядке вывода.
+    """
+    return [
+        name for name, field in serializer.fields.items()
+        if not field.write_only
+    ]
+
+
+def get_sample_outputs():
+    """
+    Ответы быстрых сериализаторов для объектов, созданных без БД:
+    связи и аннотации заданы заранее, поэтому запросов нет.
+    """
+    request = Request(HttpRequest())
+    author = User(id=1, username='author', followers_count=0)
+    recipe = Recipe(id=1, author=author, name='recipe', cooking_time=1)
+    recipe._prefetched_objects_cache = {
+        'tags': [Tag(id=1, name='tag', color='#000000', slug='tag')],
+        'ingredient': [IngredientAmount(
+            ingredients=Ingredient(id=1, name='ingredient'), amount=1
+        )],
+    }
+    author.recent_recipes = [recipe]
+    author.recipes_count = 1
+    context = {'request': request}
+    return (
+        FastRecipeSerializer(recipe, context=context).data,
+        FastUserSubscribeSerializer(author, context=context).data,
+    )
+
+
+def check_serializer_fields():
+    """
+    Сравнивает поля, которые быстрые сериализаторы собирают вручную,
+    с полями RecipeSerializer и UserSubscribeSerializer, включая
+    вложенные. Возвращает список описаний различий: новое поле
+    ModelSerializer без поля в быстром сериализаторе - ошибка.
+    """
+    recipe, subscription = get_sample_outputs()
+    recipe_serializer = RecipeSerializer()
+    pairs = (
+        ('FastRecipeSerializer', recipe, recipe_serializer),
+        (
+            'FastRecipeSerializer.tags', recipe['tags'][0],
+            recipe_serializer.fields['tags'].child,
+        ),
+        (
+            'FastRecipeSerializer.author', recipe['author'],
+            recipe_serializer.fields['author'],
+        ),
+        (
+            'FastUserSubscribeSerializer', subscription,
+            UserSubscribeSerializer(),
+        ),
+        (
+            'FastUserSubscribeSerializer.recipes',
+            subscription['recipes'][0], ShortRecipeSerializer(),
+        ),
+    )
+    differences = []
+    for name, data, serializer in pairs:
+        fields = get_readable_fields(serializer)
+        if list(data) != fields:
+            differences.append(
+                f'{name}: поля {list(data)}, '
+                f'у {type(serializer).__name__} - {fields}'
+            )
+    return differences
+
+
+@register()
+def check_fast_serializers(app_configs, **kwargs):
+    """
+    Поля быстрых сериализаторов должны совпадать с полями
+    RecipeSerializer и UserSubscribeSerializer, иначе ответы
+    с FAST_READ_SERIALIZERS расходятся с остальными.
+    """
+    return [
+        Error(
+            difference,
+            hint='Добавьте поле в api/fast_serializers.py.',
+            id='api.E001',
+        )
+        for difference in check_serializer_fields()
+    ]
@@ -0,0 +1,220 @@
+"""
+Сериализаторы только для чтения рецептов и подписок.
+Словари собираются напрямую из атрибутов объектов и предзагруженных
+связей без полей ModelSerializer. Результат совпадает с RecipeSerializer
+и UserSubscribeSerializer, это проверяет команда check_serializer_parity,
+а набор полей - системная проверка из api/checks.py.
+"""
+from operator import attrgetter
+
+from django.utils.functional import cached_property
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+from foodgram.middleware import measure
+from recipes.images import get_variant_urls
+
+from .services import get_recipes_limit
+
+TAG_FIELDS = ('id', 'name', 'color', 'slug')
+USER_FIELDS = ('email', 'id', 'username', 'first_name', 'last_name')
+SHORT_RECIPE_FIELDS = ('id', 'name')
+INGREDIENT_FIELDS = ('id', 'name', 'measurement_unit')
+
+get_tag_fields = attrgetter(*TAG_FIELDS)
+get_user_fields = attrgetter(*USER_FIELDS)
+get_short_recipe_fields = attrgetter(*SHORT_RECIPE_FIELDS)
+get_ingredient_fields = attrgetter(*INGREDIENT_FIELDS)
+
+
+def get_related(instance, name):
+    """
+    Объекты связи name, предзагруженные prefetch_related,
+    или запрос к БД, если их нет.
+    """
+    prefetched = getattr(instance, '_prefetched_objects_cache', {})
+    if name in prefetched:
+        return prefetched[name]
+    return getattr(instance, name).all()
+
+
+def get_image_url(image, request=None):
+    """
+    Ссылка на файл изображения, как у ImageField из DRF.
+    """
+    if not image:
+        return None
+    url = image.url
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def get_image_variants(recipe, request=None):
+    """
+    Ссылки на варианты изображения, как в ImageVariantsMixin.
+    """
+    urls = get_variant_urls(recipe)
+    if urls and request is not None:
+        urls = {
+            variant: request.build_absolute_uri(url)
+            for variant, url in urls.items()
+        }
+    return urls
+
+
+def get_short_recipe(recipe):
+    """
+    Рецепт в виде ShortRecipeSerializer без контекста запроса.
+    """
+    data = dict(zip(SHORT_RECIPE_FIELDS, get_short_recipe_fields(recipe)))
+    data['image'] = get_image_url(recipe.image)
+    data['image_variants'] = get_image_variants(recipe)
+    data['cooking_time'] = recipe.cooking_time
+    return data
+
+
+class ReadListSerializer(ListSerializer):
+    """
+    Список для сериализаторов этого модуля: время преобразования
+    учитывается в этапе serialize один раз для всего списка.
+    """
+
+    def to_representation(self, data):
+        with measure('serialize'):
+            return super().to_representation(data)
+
+
+class ReadSerializer(BaseSerializer):
+    """
+    Базовый сериализатор только для чтения.
+    """
+
+    class Meta:
+        list_serializer_class = ReadListSerializer
+
+    @property
+    def data(self):
+        with measure('serialize'):
+            return super().data
+
+    @cached_property
+    def request(self):
+        return self.context.get('request')
+
+    @cached_property
+    def user(self):
+        return self.request.user
+
+
+class FastRecipeSerializer(ReadSerializer):
+    """
+    Вывод рецептов для list, retrieve и feed RecipeViewSet.
+    Ожидает queryset RecipeViewSet: автор загружен select_related,
+    тэги и ингредиенты - prefetch_related, признаки избранного,
+    списка покупок и подписки на автора - аннотациями.
+    Без них выполняются те же запросы, что и в RecipeSerializer.
+    """
+
+    def to_representation(self, recipe):
+        request = self.request
+        return {
+            'id': recipe.id,
+            'tags': [
+                dict(zip(TAG_FIELDS, get_tag_fields(tag)))
+                for tag in get_related(recipe, 'tags')
+            ],
+            'author': self.get_author(recipe),
+            'ingredients': self.get_ingredients(recipe),
+            'is_favorited': self.get_flag(
+                recipe, 'is_favorited', 'favorites'
+            ),
+            'is_in_shopping_cart': self.get_flag(
+                recipe, 'is_in_shopping_cart', 'shopping_list'
+            ),
+            'favorites_count': recipe.favorites_count,
+            'name': recipe.name,
+            'image': get_image_url(recipe.image, request),
+            'image_variants': get_image_variants(recipe, request),
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+        }
+
+    def get_author(self, recipe):
+        """
+        Автор рецепта в виде UserSerializer.
+        """
+        author = recipe.author
+        data = dict(zip(USER_FIELDS, get_user_fields(author)))
+        user = self.user
+        if user.is_anonymous or user.id == author.id:
+            is_subscribed = False
+        elif hasattr(recipe, 'is_author_subscribed'):
+            is_subscribed = recipe.is_author_subscribed
+        elif hasattr(author, 'is_subscribed'):
+            is_subscribed = author.is_subscribed
+        else:
+            is_subscribed = user.follow.filter(id=author.id).exists()
+        data['is_subscribed'] = is_subscribed
+        data['followers_count'] = author.followers_count
+        return data
+
+    def get_ingredients(self, recipe):
+        """
+        Ингредиенты рецепта, как в RecipeSerializer.get_ingredients.
+        """
+        ingredient_amounts = get_related(recipe, 'ingredient')
+        if 'ingredient' not in getattr(
+                recipe, '_prefetched_objects_cache', {}):
+            ingredient_amounts = ingredient_amounts.select_related(
+                'ingredients'
+            ).order_by('ingredients__name')
+        ingredients = []
+        for ingredient_amount in ingredient_amounts:
+            data = dict(zip(
+                INGREDIENT_FIELDS,
+                get_ingredient_fields(ingredient_amount.ingredients),
+            ))
+            data['amount'] = ingredient_amount.amount
+            ingredients.append(data)
+        return ingredients
+
+    def get_flag(self, recipe, annotation, relation):
+        """
+        Признак связи текущего пользователя с рецептом:
+        из аннотации annotation или запросом к связи relation.
+        """
+        user = self.user
+        if user.is_anonymous:
+            return False
+        if hasattr(recipe, annotation):
+            return getattr(recipe, annotation)
+        return getattr(user, relation).filter(id=recipe.id).exists()
+
+
+class FastUserSubscribeSerializer(ReadSerializer):
+    """
+    Вывод авторов для UserViewSet.subscriptions.
+    Ожидает рецепты, загруженные prefetch_recent_recipes.
+    """
+
+    def to_representation(self, author):
+        data = dict(zip(USER_FIELDS, get_user_fields(author)))
+        data['is_subscribed'] = True
+        data['followers_count'] = author.followers_count
+        data['recipes'] = [
+            get_short_recipe(recipe) for recipe in self.get_recipes(author)
+        ]
+        data['recipes_count'] = author.recipes_count
+        return data
+
+    def get_recipes(self, author):
+        """
+        Рецепты автора, как в UserSubscribeSerializer.get_recipes.
+        """
+        if hasattr(author, 'recent_recipes'):
+            return author.recent_recipes
+        recipes = author.recipes.all()
+        limit = get_recipes_limit(self.request.query_params)
+        if limit is not None:
+            recipes = recipes[:limit]
+        return recipes
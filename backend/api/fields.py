@@ -0,0 +1,29 @@
+from django.conf import settings
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework.serializers import ValidationError
+
+
+class RecipeImageField(Base64ImageField):
+    """
+    Base64ImageField с ограничением размера файла и сторон изображения.
+    Размер файла проверяется по длине base64-строки до декодирования.
+    """
+
+    def to_internal_value(self, base64_data):
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        if isinstance(base64_data, str) and len(base64_data) * 3 // 4 > (
+                max_size):
+            raise ValidationError(
+                f'Размер изображения больше {max_size // 1024} КБ.'
+            )
+        image = super().to_internal_value(base64_data)
+        if image is None:
+            return image
+        max_side = settings.RECIPE_IMAGE_MAX_SIDE
+        if max(Image.open(image).size) > max_side:
+            raise ValidationError(
+                f'Сторона изображения больше {max_side} пикселей.'
+            )
+        image.seek(0)
+        return image
@@ -0,0 +1,160 @@
+import json
+import platform
+from io import StringIO
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.benchmark import SCENARIOS, compare, run_benchmark, test_database
+from recipes.seeding import Dataset
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Бенчмарк эндпоинтов API на синтетических данных '
+        'во временной тестовой БД'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale',
+            type=float,
+            default=1,
+            help='Масштаб набора данных (1 - 100 пользователей '
+                 'и 500 рецептов)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Начальное значение генератора данных',
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=30,
+            help='Количество замеров для каждого эндпоинта',
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=3,
+            help='Количество запросов перед замерами',
+        )
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            choices=[scenario.name for scenario in SCENARIOS],
+            help='Выполнить только указанные сценарии',
+        )
+        parser.add_argument(
+            '--baseline',
+            help='JSON-файл с базовыми результатами для сравнения',
+        )
+        parser.add_argument(
+            '--save',
+            action='store_true',
+            help='Записать результаты в файл --baseline',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.25,
+            help='Допустимый относительный рост времени ответа',
+        )
+
+    def handle(self, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations должен быть больше нуля.')
+        if options['save'] and not options['baseline']:
+            raise CommandError('Для --save нужно указать --baseline.')
+        baseline = None
+        if options['baseline'] and not options['save']:
+            try:
+                with open(options['baseline'], encoding='UTF-8') as file:
+                    baseline = json.load(file)
+            except (OSError, ValueError) as error:
+                raise CommandError(f'Ошибка чтения базовых результатов: '
+                                   f'{error}')
+
+        scenarios = SCENARIOS
+        if options['scenario']:
+            scenarios = [
+                scenario for scenario in SCENARIOS
+                if scenario.name in options['scenario']
+            ]
+        meta = {
+            'scale': options['scale'],
+            'seed': options['seed'],
+            'vendor': connection.vendor,
+            'iterations': options['iterations'],
+            'python': platform.python_version(),
+            'django': django.get_version(),
+        }
+        results = self.run(options, scenarios)
+        self.print_results(results, baseline)
+
+        if options['save']:
+            with open(options['baseline'], 'w', encoding='UTF-8') as file:
+                json.dump({'meta': meta, 'endpoints': results}, file,
+                          ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(
+                f'Результаты записаны в {options["baseline"]}.'
+            ))
+        if baseline is None:
+            return
+
+        base_meta = baseline.get('meta', {})
+        for key in ('scale', 'seed', 'vendor'):
+            if base_meta.get(key) != meta[key]:
+                raise CommandError(
+                    f'Базовые результаты получены с {key}='
+                    f'{base_meta.get(key)}, текущие - с {key}={meta[key]}.'
+                )
+        regressions = compare(
+            results, baseline.get('endpoints', {}), options['tolerance']
+        )
+        if regressions:
+            raise CommandError(
+                'Найдены регрессии:\n' + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS('Регрессий не найдено.'))
+
+    def run(self, options, scenarios):
+        """
+        Создаёт тестовую БД, заполняет её и выполняет сценарии.
+        """
+        verbosity = options['verbosity']
+        with test_database(verbosity=max(0, verbosity - 1)):
+            counts = Dataset(options['scale'], options['seed']).create(
+                stdout=self.stdout if verbosity > 1 else StringIO(),
+                verbosity=verbosity,
+            )
+            if verbosity > 0:
+                self.stdout.write('Создано объектов: ' + ', '.join(
+                    f'{label} {count}' for label, count in counts.items()
+                ))
+            return run_benchmark(
+                options['iterations'], options['warmup'], scenarios
+            )
+
+    def print_results(self, results, baseline):
+        base = (baseline or {}).get('endpoints', {})
+        self.stdout.write(
+            f'{"эндпоинт":<26}{"p50, мс":>10}{"p90, мс":>10}'
+            f'{"p99, мс":>10}{"SQL":>6}'
+        )
+        for name, result in results.items():
+            line = (
+                f'{name:<26}{result["p50_ms"]:>10.2f}'
+                f'{result["p90_ms"]:>10.2f}{result["p99_ms"]:>10.2f}'
+                f'{result["queries"]:>6}'
+            )
+            if name in base:
+                line += (
+                    f'  (было {base[name]["p50_ms"]:.2f} мс, '
+                    f'{base[name]["queries"]} SQL)'
+                )
+            self.stdout.write(line)
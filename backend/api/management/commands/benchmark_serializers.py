@@ -0,0 +1,78 @@
+from io import StringIO
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmark import benchmark_serializers, test_database
+from recipes.seeding import Dataset
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Сравнение времени сериализации страницы рецептов и подписок '
+        'ModelSerializer и быстрыми сериализаторами во временной тестовой БД'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale',
+            type=float,
+            default=1,
+            help='Масштаб набора данных',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Начальное значение генератора данных',
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=50,
+            help='Количество замеров для каждого сериализатора',
+        )
+        parser.add_argument(
+            '--size',
+            type=int,
+            default=20,
+            help='Количество объектов на странице',
+        )
+
+    def handle(self, **options):
+        if options['iterations'] < 1 or options['size'] < 1:
+            raise CommandError(
+                '--iterations и --size должны быть больше нуля.'
+            )
+        verbosity = options['verbosity']
+        with test_database(verbosity=max(0, verbosity - 1)):
+            Dataset(options['scale'], options['seed']).create(
+                stdout=StringIO()
+            )
+            results = benchmark_serializers(
+                options['iterations'], options['size']
+            )
+
+        self.stdout.write(
+            f'{"страница":<20}{"объектов":>10}{"p50, мс":>10}'
+            f'{"быстрый, мс":>13}{"ускорение":>11}'
+        )
+        for name, result in results.items():
+            speedup = result['p50_ms'] / max(result['fast_p50_ms'], 0.001)
+            self.stdout.write(
+                f'{name:<20}{result["objects"]:>10}'
+                f'{result["p50_ms"]:>10.2f}{result["fast_p50_ms"]:>13.2f}'
+                f'{speedup:>10.1f}x'
+            )
+        different = [name for name, result in results.items()
+                     if not result['equal']]
+        if different:
+            raise CommandError(
+                'Результаты сериализаторов различаются: '
+                + ', '.join(different)
+            )
+        queries = sum(result['queries'] for result in results.values())
+        if queries:
+            self.stdout.write(self.style.WARNING(
+                f'Во время замеров выполнено SQL-запросов: {queries}.'
+            ))
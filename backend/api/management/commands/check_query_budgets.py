@@ -0,0 +1,54 @@
+from io import StringIO
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmark import test_database
+from api.query_budgets import check_query_budgets
+from recipes.seeding import Dataset
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Проверка количества SQL-запросов эндпоинтов API '
+        'по бюджетам из api/query_budgets.py во временной тестовой БД'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale',
+            type=float,
+            default=0.5,
+            help='Масштаб набора данных',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Начальное значение генератора данных',
+        )
+
+    def handle(self, **options):
+        verbosity = options['verbosity']
+        with test_database(verbosity=max(0, verbosity - 1)):
+            Dataset(options['scale'], options['seed']).create(
+                stdout=StringIO()
+            )
+            results = check_query_budgets()
+
+        failures = 0
+        for route, summary, error in results:
+            label = ' '.join(route)
+            if error is None:
+                if verbosity > 1:
+                    self.stdout.write(f'{label}: {summary}')
+                continue
+            failures += 1
+            self.stdout.write(self.style.ERROR(
+                f'{label}: {summary} - {error}'
+            ))
+        if failures:
+            raise CommandError(f'Нарушено бюджетов: {failures}.')
+        self.stdout.write(self.style.SUCCESS(
+            f'Все бюджеты SQL-запросов соблюдены ({len(results)} проверок).'
+        ))
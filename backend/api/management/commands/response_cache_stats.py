@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from api.cache import response_cache
+
+
+class Command(BaseCommand):
+
+    help = 'Счётчики попаданий и промахов кэша ответов API'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Обнулить счётчики после вывода',
+        )
+
+    def handle(self, **options):
+        stats = response_cache.get_stats()
+        total = stats['hits'] + stats['misses']
+        hit_rate = stats['hits'] / total * 100 if total else 0
+        self.stdout.write(
+            f"Попаданий: {stats['hits']}, промахов: {stats['misses']}, "
+            f'доля попаданий: {hit_rate:.1f}%'
+        )
+        if options['reset']:
+            response_cache.reset_stats()
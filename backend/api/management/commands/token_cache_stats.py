@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from api.cache import token_cache
+
+
+class Command(BaseCommand):
+
+    help = 'Счётчики попаданий и промахов кэша токенов аутентификации'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Обнулить счётчики после вывода',
+        )
+
+    def handle(self, **options):
+        stats = token_cache.get_stats()
+        hits = stats['local_hits'] + stats['shared_hits']
+        total = hits + stats['misses']
+        hit_rate = hits / total * 100 if total else 0
+        self.stdout.write(
+            f"Попаданий в кэш процесса: {stats['local_hits']}, "
+            f"в общий кэш: {stats['shared_hits']}, "
+            f"промахов: {stats['misses']}, "
+            f'доля попаданий: {hit_rate:.1f}%'
+        )
+        if options['reset']:
+            token_cache.reset_stats()
@@ -3,11 +3,17 @@
 основных классов приложения.
 """
 
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from rest_framework.response import Response
 from rest_framework.status import (HTTP_201_CREATED, HTTP_204_NO_CONTENT,
                                    HTTP_400_BAD_REQUEST, HTTP_401_UNAUTHORIZED)
 
+from .cache import response_cache
+from .services import add_relation, remove_relation
+
 
 class AddDelViewMixin:
     """
@@ -17,7 +23,11 @@ class AddDelViewMixin:
 
     def add_remove_relation(self, obj_id, manager):
         """
-        Меняет ManyToMany-связь
+        Меняет ManyToMany-связь.
+        Связь создаётся или удаляется одним запросом к таблице связей,
+        ответ 201/204/400 определяется по количеству изменённых строк.
+        Объект проверяется отдельным запросом только для ответа 201
+        и при неизменённой связи, чтобы отличить 400 от 404.
         """
         assert self.add_serializer is not None, (
             f'{self.__class__.__name__} должен включать '
@@ -28,24 +38,59 @@ class AddDelViewMixin:
         if user.is_anonymous:
             return Response(status=HTTP_401_UNAUTHORIZED)
 
-        managers = {
-            'follow_M2M': user.follow,
-            'is_favorite_M2M': user.favorites,
-            'shopping_cart_M2M': user.shopping_list,
-        }
-        manager = managers[manager]
+        try:
+            obj_id = self.queryset.model._meta.pk.to_python(obj_id)
+        except ValidationError:
+            raise Http404
+
+        if self.request.method in ('GET', 'POST',):
+            if add_relation(manager, user.id, obj_id):
+                obj = get_object_or_404(self.queryset, id=obj_id)
+                serializer = self.add_serializer(
+                    obj, context={'request': self.request}
+                )
+                return Response(serializer.data, status=HTTP_201_CREATED)
+        elif remove_relation(manager, user.id, obj_id):
+            return Response(status=HTTP_204_NO_CONTENT)
+
+        if not self.queryset.model.objects.filter(id=obj_id).exists():
+            raise Http404
+        return Response(status=HTTP_400_BAD_REQUEST)
+
+
+class ResponseCacheMixin:
+    """
+    Кэширует ответы list и retrieve для анонимных пользователей.
+    Ответы авторизованным пользователям содержат персональные поля
+    и не кэшируются.
+    """
+    cache_models = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs
+        )
 
-        obj = get_object_or_404(self.queryset, id=obj_id)
-        serializer = self.add_serializer(
-            obj, context={'request': self.request}
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs
         )
-        obj_exist = manager.filter(id=obj_id).exists()
 
-        if (self.request.method in ('GET', 'POST',)) and not obj_exist:
-            manager.add(obj)
-            return Response(serializer.data, status=HTTP_201_CREATED)
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        """
+        Возвращает ответ из кэша или вызывает handler и кэширует его.
+        """
+        if (not settings.RESPONSE_CACHE_ENABLED
+                or request.user.is_authenticated):
+            return handler(request, *args, **kwargs)
+
+        key = response_cache.make_key(self, request, self.cache_models)
+        data = response_cache.get(key)
+        if data is not None:
+            return Response(data, headers={'X-Cache': 'HIT'})
 
-        if (self.request.method in ('DELETE', )) and obj_exist:
-            manager.remove(obj)
-            return Response(status=HTTP_204_NO_CONTENT)
-        return Response(status=HTTP_400_BAD_REQUEST)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            response_cache.set(key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
@@ -1,9 +1,179 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (BasePagination, PageNumberPagination,
+                                       _positive_int)
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинатор по ключу сортировки (keyset).
+    Вместо OFFSET и COUNT(*) следующая страница выбирается условием
+    "после последнего показанного объекта", поэтому любая страница
+    обходится так же дёшево, как первая.
+    Ключ берётся из атрибута `keyset_ordering` представления и должен
+    однозначно упорядочивать объекты (последнее поле - `id`).
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = 6
+    max_page_size = 100
+    ordering = ('-create_data', '-id')
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.get_page(self.filter_queryset(queryset, request, view))
+
+    def filter_queryset(self, queryset, request, view=None):
+        """
+        Упорядочивает queryset по ключу и отбрасывает объекты
+        до позиции из курсора. Условие на позицию сохраняется
+        в `position_filter`.
+        """
+        self.page_size = self.get_page_size(request)
+        self.base_url = remove_query_param(
+            request.build_absolute_uri(), 'page'
+        )
+        ordering = getattr(view, 'keyset_ordering', self.ordering)
+        keys = [
+            (field.lstrip('-'), field.startswith('-')) for field in ordering
+        ]
+        self.position, self.reverse = self.decode_cursor(
+            request, queryset, keys
+        )
+        if self.reverse:
+            keys = [(name, not descending) for name, descending in keys]
+        self.keys = [name for name, _ in keys]
+
+        queryset = queryset.order_by(*(
+            f'-{name}' if descending else name for name, descending in keys
+        ))
+        self.position_filter = Q()
+        if self.position is not None:
+            self.position_filter = self.get_keyset_filter(keys, self.position)
+            queryset = queryset.filter(self.position_filter)
+        return queryset
+
+    def get_page(self, queryset):
+        """
+        Выбирает страницу из queryset, подготовленного filter_queryset.
+        """
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.position is not None
+
+        self.first = results[0] if results else None
+        self.last = results[-1] if results else None
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size,
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_next_link(self):
+        if not self.has_next or self.last is None:
+            return None
+        return self.encode_cursor(self.last, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first is None:
+            return None
+        return self.encode_cursor(self.first, reverse=True)
+
+    def get_keyset_filter(self, keys, position):
+        """
+        Условие "после позиции position" для составного ключа keys:
+        (a < x) OR (a = x AND b < y) OR ...
+        """
+        condition = Q()
+        for index, (name, descending) in enumerate(keys):
+            lookup = 'lt' if descending else 'gt'
+            condition |= Q(
+                **dict(zip((key for key, _ in keys[:index]), position)),
+                **{f'{name}__{lookup}': position[index]},
+            )
+        return condition
+
+    def encode_cursor(self, obj, reverse):
+        values = [getattr(obj, name) for name in self.keys]
+        cursor = json.dumps({
+            'position': [
+                value.isoformat() if hasattr(value, 'isoformat') else value
+                for value in values
+            ],
+            'reverse': reverse,
+        })
+        return replace_query_param(
+            self.base_url,
+            self.cursor_query_param,
+            urlsafe_b64encode(cursor.encode()).decode(),
+        )
+
+    def decode_cursor(self, request, queryset, keys):
+        """
+        Возвращает позицию и направление из параметра `cursor`.
+        Пустой параметр означает первую страницу.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode()))
+            position = [
+                queryset.model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(keys, cursor['position'])
+            ]
+            if len(position) != len(keys):
+                raise ValueError
+            return position, bool(cursor['reverse'])
+        except (BinasciiError, ValidationError, ValueError, TypeError,
+                KeyError):
+            raise NotFound(self.invalid_cursor_message)
 
 
 class PageLimitPagination(PageNumberPagination):
     """
     Стандартный пагинатор с определением атрибута
     'page_size_query_param', для вывода запрошенного количества страниц.
+    При наличии в запросе параметра `cursor` (для первой страницы -
+    пустого) переключается на пагинацию по ключу KeysetPagination.
     """
     page_size_query_param = 'limit'
+    keyset_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.keyset_class.cursor_query_param in request.query_params:
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,369 @@
+"""
+Допустимое количество SQL-запросов для маршрутов роутера API
+и проверка эндпоинтов на соответствие ему.
+"""
+import base64
+from collections import namedtuple
+from io import BytesIO
+from tempfile import TemporaryDirectory
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from foodgram.middleware import normalize_sql
+from recipes.models import Ingredient, IngredientAmount, Recipe, Tag
+from recipes.seeding import PASSWORD
+
+from .benchmark import get_context
+from .urls import router
+
+# path - путь запроса, в нём подставляются значения из get_context()
+# и prepare_context();
+# anonymous, authenticated - наибольшее количество SQL-запросов для
+# анонимного и авторизованного пользователя, None - не проверяется;
+# paginated - количество запросов не должно зависеть от размера страницы;
+# data - тело запроса или функция (контекст, размер) -> тело запроса;
+# scaled - количество запросов не должно зависеть от количества тэгов
+# и ингредиентов в теле запроса (размера из PAYLOAD_SIZES);
+# rollback - изменения запроса откатываются, чтобы не влиять
+# на следующие проверки.
+Budget = namedtuple(
+    'Budget',
+    'path anonymous authenticated paginated data scaled rollback',
+    defaults=(False, None, False, False),
+)
+
+
+def get_recipe_data(context, size=1):
+    """
+    Тело запроса для создания и изменения рецепта с size ингредиентами
+    и size тэгами (или всеми, если их меньше).
+    """
+    return {
+        'name': 'Бюджет запросов',
+        'text': 'Рецепт для проверки количества SQL-запросов.',
+        'cooking_time': 10,
+        'image': context['image'],
+        'tags': context['tag_ids'][:size],
+        'ingredients': [
+            {'id': ingredient_id, 'amount': 10}
+            for ingredient_id in context['ingredient_ids'][:size]
+        ],
+    }
+
+
+USER_DATA = {
+    'email': 'budget@example.com',
+    'username': 'budget',
+    'first_name': 'Бюджет',
+    'last_name': 'Запросов',
+    'password': 'Budget-password-1',
+}
+
+# {(имя маршрута, метод): Budget}. Запросы выполняются в этом порядке,
+# поэтому связь создаётся (POST) до удаления (DELETE).
+QUERY_BUDGETS = {
+    ('tags-list', 'GET'): Budget('/api/tags/', 1, 1),
+    ('tags-detail', 'GET'): Budget('/api/tags/{tag_id}/', 1, 1),
+    ('ingredients-list', 'GET'): Budget(
+        '/api/ingredients/?name={ingredient_prefix}', 1, 1
+    ),
+    ('ingredients-detail', 'GET'): Budget(
+        '/api/ingredients/{ingredient}/', 1, 1
+    ),
+    # Авторизованному признаки рецептов страницы выбираются
+    # отдельным запросом, чтобы COUNT(*) был без подзапросов.
+    ('recipes-list', 'GET'): Budget(
+        '/api/recipes/?tags={tag}&tags={other_tag}', 4, 5, paginated=True
+    ),
+    ('recipes-list', 'POST'): Budget(
+        '/api/recipes/', 0, 12, data=get_recipe_data, scaled=True,
+        rollback=True,
+    ),
+    ('recipes-detail', 'GET'): Budget('/api/recipes/{recipe}/', 3, 3),
+    ('recipes-detail', 'PUT'): Budget(
+        '/api/recipes/{own_recipe}/', 0, 21, data=get_recipe_data,
+        scaled=True, rollback=True,
+    ),
+    ('recipes-detail', 'PATCH'): Budget(
+        '/api/recipes/{own_recipe}/', 0, 21, data=get_recipe_data,
+        scaled=True, rollback=True,
+    ),
+    ('recipes-detail', 'DELETE'): Budget(
+        '/api/recipes/{own_recipe}/', 0, 18, rollback=True
+    ),
+    ('recipes-feed', 'GET'): Budget(
+        '/api/recipes/feed/', 0, 4, paginated=True
+    ),
+    ('recipes-favorite', 'POST'): Budget(
+        '/api/recipes/{recipe}/favorite/', 0, 6
+    ),
+    ('recipes-favorite', 'DELETE'): Budget(
+        '/api/recipes/{recipe}/favorite/', 0, 4
+    ),
+    ('recipes-favorite', 'GET'): Budget(
+        '/api/recipes/{recipe}/favorite/', 0, 6
+    ),
+    ('recipes-shopping-cart', 'POST'): Budget(
+        '/api/recipes/{recipe}/shopping_cart/', 0, 10
+    ),
+    ('recipes-shopping-cart', 'DELETE'): Budget(
+        '/api/recipes/{recipe}/shopping_cart/', 0, 7
+    ),
+    ('recipes-shopping-cart', 'GET'): Budget(
+        '/api/recipes/{recipe}/shopping_cart/', 0, 10
+    ),
+    ('recipes-download-shopping-cart', 'GET'): Budget(
+        '/api/recipes/download_shopping_cart/', 0, 2
+    ),
+    ('users-list', 'GET'): Budget('/api/users/', 2, 2, paginated=True),
+    ('users-list', 'POST'): Budget(
+        '/api/users/', 4, None, data=USER_DATA, rollback=True
+    ),
+    ('users-detail', 'GET'): Budget('/api/users/{author}/', 1, 1),
+    ('users-detail', 'PUT'): Budget(
+        '/api/users/{user}/', 0, 6, data=USER_DATA, rollback=True
+    ),
+    ('users-detail', 'PATCH'): Budget(
+        '/api/users/{user}/', 0, 4, data={'first_name': 'Бюджет'},
+        rollback=True,
+    ),
+    ('users-detail', 'DELETE'): Budget(
+        '/api/users/{user}/', 0, 51,
+        data={'current_password': PASSWORD}, rollback=True,
+    ),
+    ('users-me', 'GET'): Budget('/api/users/me/', 0, 1),
+    ('users-me', 'PUT'): Budget(
+        '/api/users/me/', 0, 6, data=USER_DATA, rollback=True
+    ),
+    ('users-me', 'PATCH'): Budget(
+        '/api/users/me/', 0, 4, data={'first_name': 'Бюджет'},
+        rollback=True,
+    ),
+    ('users-me', 'DELETE'): Budget(
+        '/api/users/me/', 0, 51,
+        data={'current_password': PASSWORD}, rollback=True,
+    ),
+    ('users-set-password', 'POST'): Budget(
+        '/api/users/set_password/', 0, 3, data={
+            'current_password': PASSWORD,
+            'new_password': 'Budget-password-2',
+        }, rollback=True,
+    ),
+    ('users-subscriptions', 'GET'): Budget(
+        '/api/users/subscriptions/?recipes_limit=3', 0, 3, paginated=True
+    ),
+    ('users-subscribe', 'POST'): Budget(
+        '/api/users/{author}/subscribe/', 0, 5
+    ),
+    ('users-subscribe', 'DELETE'): Budget(
+        '/api/users/{author}/subscribe/', 0, 4
+    ),
+    ('users-subscribe', 'GET'): Budget(
+        '/api/users/{author}/subscribe/', 0, 5
+    ),
+}
+
+# Маршруты djoser, которые проект не использует: активация
+# и восстановление пароля или логина по почте.
+SKIPPED_ROUTES = {
+    'users-activation',
+    'users-resend-activation',
+    'users-reset-password',
+    'users-reset-password-confirm',
+    'users-reset-username',
+    'users-reset-username-confirm',
+    'users-set-username',
+}
+
+PAGE_SIZES = (1, 6, 20)
+PAGE_SIZE_QUERY_PARAM = 'limit'
+PAYLOAD_SIZES = (1, 3, 10)
+
+# Управление транзакциями не учитывается: откат изменений добавляет
+# точки сохранения, а BEGIN в журнале запросов есть только у SQLite.
+TRANSACTION_STATEMENTS = ('BEGIN', 'SAVEPOINT', 'RELEASE', 'ROLLBACK')
+
+
+def get_routes():
+    """
+    Возвращает пары (имя маршрута, метод) роутера API.
+    """
+    routes = set()
+    for pattern in router.urls:
+        actions = getattr(pattern.callback, 'actions', None)
+        if not actions or pattern.name in SKIPPED_ROUTES:
+            continue
+        routes.update(
+            (pattern.name, method.upper())
+            for method in actions if method != 'head'
+        )
+    return routes
+
+
+def count_queries(client, method, path, data=None, rollback=False):
+    """
+    Выполняет запрос и возвращает его статус и SQL-запросы
+    без управления транзакциями. При rollback изменения откатываются.
+    """
+    with CaptureQueriesContext(connection) as queries:
+        with transaction.atomic():
+            response = getattr(client, method.lower())(
+                path, data, format='json'
+            )
+            if response.streaming:
+                b''.join(response.streaming_content)
+            transaction.set_rollback(rollback)
+    return response.status_code, [
+        query['sql'] for query in queries
+        if not query['sql'].upper().startswith(TRANSACTION_STATEMENTS)
+    ]
+
+
+def format_queries(queries):
+    """
+    Сгруппированные SQL-запросы, повторяющиеся - первыми.
+    """
+    counts = {}
+    for sql in queries:
+        sql = normalize_sql(sql)
+        counts[sql] = counts.get(sql, 0) + 1
+    return '\n'.join(
+        f'    {count} x {sql}'
+        for sql, count in sorted(counts.items(), key=lambda item: -item[1])
+    )
+
+
+def get_image():
+    """
+    Изображение 1x1 в base64, как его присылает фронтенд.
+    """
+    buffer = BytesIO()
+    Image.new('RGB', (1, 1)).save(buffer, 'PNG')
+    return (
+        'data:image/png;base64,'
+        + base64.b64encode(buffer.getvalue()).decode()
+    )
+
+
+def prepare_context(user):
+    """
+    Значения для изменяющих запросов: рецепт пользователя user
+    (создаётся, если у пользователя их нет), изображение и тэги
+    с ингредиентами, которых нет в этом рецепте, - изменение
+    рецепта телом любого размера добавляет и удаляет строки.
+    """
+    own_recipe = Recipe.objects.filter(author=user).order_by('id').first()
+    if own_recipe is None:
+        own_recipe = Recipe.objects.create(
+            author=user,
+            name='Рецепт для проверки',
+            text='Рецепт для проверки количества SQL-запросов.',
+            cooking_time=10,
+            image='recipe_pictures/budget.jpg',
+        )
+        own_recipe.tags.add(Tag.objects.order_by('id').first())
+        IngredientAmount.objects.create(
+            recipe=own_recipe,
+            ingredients=Ingredient.objects.order_by('id').first(),
+            amount=10,
+        )
+    tag_ids = Tag.objects.exclude(recipes=own_recipe).order_by('id')
+    ingredient_ids = Ingredient.objects.exclude(
+        recipes=own_recipe
+    ).order_by('id')
+    return {
+        'tag_ids': list(tag_ids.values_list('id', flat=True)),
+        'ingredient_ids': list(ingredient_ids.values_list(
+            'id', flat=True
+        )[:max(PAYLOAD_SIZES)]),
+        'image': get_image(),
+        'own_recipe': own_recipe.id,
+    }
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+def check_query_budgets():
+    """
+    Выполняет запросы ко всем маршрутам из QUERY_BUDGETS от имени
+    анонимного и авторизованного пользователя.
+    Возвращает список (маршрут, результат, ошибка или None).
+    Кэш ответов отключается, кэш токенов прогревается заранее
+    и после каждого откаченного запроса, поэтому проверяется
+    количество запросов без кэша ответов.
+    Загруженные изображения сохраняются во временный каталог.
+    """
+    with TemporaryDirectory() as media_root:
+        with override_settings(MEDIA_ROOT=media_root):
+            return _check_query_budgets()
+
+
+def _check_query_budgets():
+    user, context = get_context()
+    context.update(prepare_context(user))
+    token, _ = Token.objects.get_or_create(user=user)
+    clients = {'anonymous': APIClient(), 'authenticated': APIClient()}
+    clients['authenticated'].credentials(
+        HTTP_AUTHORIZATION=f'Token {token.key}'
+    )
+    clients['authenticated'].get('/api/users/me/')
+
+    results = []
+    missing = get_routes() - set(QUERY_BUDGETS)
+    for route in sorted(missing):
+        results.append((route, 'нет бюджета', 'маршрут не описан в '
+                                              'QUERY_BUDGETS'))
+    for (name, method), budget in QUERY_BUDGETS.items():
+        path = budget.path.format(**context)
+        for caller, client in clients.items():
+            limit = getattr(budget, caller)
+            if limit is None:
+                continue
+            route = (name, method, caller)
+            sizes = (None,)
+            if budget.paginated:
+                sizes = PAGE_SIZES
+            elif budget.scaled:
+                sizes = PAYLOAD_SIZES
+            counts = []
+            for size in sizes:
+                page_path, data = path, budget.data
+                if budget.paginated:
+                    separator = '&' if '?' in path else '?'
+                    page_path = (f'{path}{separator}'
+                                 f'{PAGE_SIZE_QUERY_PARAM}={size}')
+                if callable(data):
+                    data = data(context, size or 1)
+                status, queries = count_queries(
+                    client, method, page_path, data, budget.rollback
+                )
+                if budget.rollback and caller == 'authenticated':
+                    # Изменение и удаление пользователя убирают его
+                    # токен из кэша токенов, откат его не возвращает.
+                    client.get('/api/users/me/')
+                counts.append(len(queries))
+                summary = f'{status}, SQL-запросов: {len(queries)}/{limit}'
+                if budget.paginated:
+                    summary += f', размер страницы {size}'
+                elif budget.scaled:
+                    summary += f', размер тела {size}'
+                error = None
+                if status >= 500:
+                    error = f'ошибка сервера {status}'
+                elif caller == 'authenticated' and status >= 400:
+                    error = f'запрос не выполнен: {status}'
+                elif len(queries) > limit:
+                    error = 'превышен бюджет'
+                elif len(counts) > 1 and counts[-1] > counts[0]:
+                    error = (
+                        'количество запросов растёт с размером '
+                        + ('страницы' if budget.paginated else 'тела')
+                        + ': ' + ' -> '.join(map(str, counts))
+                    )
+                if error is not None:
+                    error += f'\n  {page_path}\n' + format_queries(queries)
+                results.append((route, summary, error))
+    return results
@@ -0,0 +1,23 @@
+from rest_framework.renderers import BaseRenderer
+
+
+class PlainTextRenderer(BaseRenderer):
+    """
+    Рендерер для выгрузки в текстовом формате.
+    """
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return str(data).encode(self.charset)
+
+
+class CSVRenderer(PlainTextRenderer):
+    """
+    Рендерер для выгрузки в формате CSV.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
@@ -0,0 +1,127 @@
+"""
+Проверка совпадения ответов API с быстрыми сериализаторами
+(FAST_READ_SERIALIZERS) и с сериализаторами ModelSerializer.
+"""
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+
+from .benchmark import get_context
+
+# Запросы, ответы на которые сравниваются: (путь, анонимный).
+# В путях подставляются значения из get_context() и prepare_recipes().
+PARITY_REQUESTS = (
+    ('/api/recipes/?limit=20', True),
+    ('/api/recipes/?limit=20', False),
+    ('/api/recipes/?limit=20&page=2', False),
+    ('/api/recipes/?tags={tag}&tags={other_tag}&limit=20', False),
+    ('/api/recipes/?author={author}', False),
+    ('/api/recipes/?author={user}', False),
+    ('/api/recipes/?is_favorited=1&limit=20', False),
+    ('/api/recipes/?is_in_shopping_cart=0&limit=20', False),
+    ('/api/recipes/?cursor=&limit=20', False),
+    ('/api/recipes/?cursor=&limit=20', True),
+    ('/api/recipes/{recipe}/', True),
+    ('/api/recipes/{recipe}/', False),
+    ('/api/recipes/{own_recipe}/', False),
+    ('/api/recipes/{variants_recipe}/', False),
+    ('/api/recipes/{variants_recipe}/', True),
+    ('/api/recipes/{no_image_recipe}/', False),
+    ('/api/recipes/feed/?limit=20', False),
+    ('/api/users/subscriptions/', False),
+    ('/api/users/subscriptions/?limit=20', False),
+    ('/api/users/subscriptions/?limit=20&recipes_limit=3', False),
+    ('/api/users/subscriptions/?limit=20&page=2&recipes_limit=1', False),
+)
+
+
+def prepare_recipes(user):
+    """
+    Готовит рецепты для сравнения ссылок на изображения:
+    у части рецептов отмечаются варианты изображения, у одного
+    удаляется изображение. Возвращает значения для подстановки в пути.
+    Изменяет данные, поэтому выполняется только в тестовой БД.
+    """
+    ids = list(Recipe.objects.order_by('id').values_list('id', flat=True))
+    Recipe.objects.filter(id__in=ids[::3]).update(has_image_variants=True)
+    Recipe.objects.filter(id=ids[1]).update(image='')
+    own_recipe = Recipe.objects.filter(author=user).first()
+    return {
+        'variants_recipe': ids[0],
+        'no_image_recipe': ids[1],
+        'own_recipe': own_recipe.id if own_recipe else ids[0],
+    }
+
+
+def get_response(client, path, fast):
+    """
+    Тело ответа на запрос path и количество SQL-запросов
+    с быстрыми сериализаторами или без них.
+    """
+    with override_settings(FAST_READ_SERIALIZERS=fast):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(path)
+    return response.status_code, response.content, len(queries)
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+def check_serializer_parity():
+    """
+    Выполняет запросы из PARITY_REQUESTS с быстрыми сериализаторами
+    и без них. Возвращает список (запрос, результат, ошибка или None).
+    Ответы должны совпадать побайтно, а SQL-запросов с быстрыми
+    сериализаторами должно быть не больше.
+    """
+    user, context = get_context()
+    context.update(prepare_recipes(user))
+    token, _ = Token.objects.get_or_create(user=user)
+    clients = {'anonymous': APIClient(), 'authenticated': APIClient()}
+    clients['authenticated'].credentials(
+        HTTP_AUTHORIZATION=f'Token {token.key}'
+    )
+    clients['authenticated'].get('/api/users/me/')
+
+    results = []
+    for path, anonymous in PARITY_REQUESTS:
+        caller = 'anonymous' if anonymous else 'authenticated'
+        path = path.format(**context)
+        client = clients[caller]
+        status, content, queries = get_response(client, path, fast=False)
+        fast_status, fast_content, fast_queries = get_response(
+            client, path, fast=True
+        )
+        summary = (f'{fast_status}, {len(fast_content)} байт, '
+                   f'SQL-запросов: {queries} -> {fast_queries}')
+        error = None
+        if status != 200:
+            error = f'статус ответа {status}'
+        elif fast_status != status:
+            error = f'статус ответа {status} -> {fast_status}'
+        elif fast_content != content:
+            error = get_difference(content, fast_content)
+        elif fast_queries > queries:
+            error = 'SQL-запросов больше'
+        results.append(((path, caller), summary, error))
+    return results
+
+
+def get_difference(content, fast_content, width=60):
+    """
+    Описание первого различия ответов.
+    """
+    position = next(
+        (
+            index for index, (byte, fast_byte)
+            in enumerate(zip(content, fast_content)) if byte != fast_byte
+        ),
+        min(len(content), len(fast_content)),
+    )
+    start = max(0, position - width // 2)
+    return (
+        f'ответы различаются с байта {position}:\n'
+        f'    было:  {content[start:start + width]}\n'
+        f'    стало: {fast_content[start:start + width]}'
+    )
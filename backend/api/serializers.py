@@ -1,30 +1,67 @@
 from django.contrib.auth import get_user_model
 from django.db import transaction
-from django.db.models import F
-from drf_extra_fields.fields import Base64ImageField
-from rest_framework.serializers import (ModelSerializer, SerializerMethodField,
+from rest_framework.serializers import (CharField, JSONField, ModelSerializer,
+                                        Serializer, SerializerMethodField,
                                         ValidationError)
 
+from foodgram.middleware import measure
+from recipes.images import get_variant_urls, image_processor
 from recipes.models import Ingredient, Recipe, Tag
 
-from .services import (check_value_validate,
-                       enter_ingredient_amount_in_recipe, is_hex_color)
+from .fields import RecipeImageField
+from .services import (check_objects_exist, check_value_validate,
+                       enter_ingredient_amount_in_recipe, get_recipes_limit,
+                       is_hex_color, update_ingredient_amounts_in_recipe)
 
 User = get_user_model()
 
 
-class ShortRecipeSerializer(ModelSerializer):
+class SerializeTimingMixin:
+    """
+    Учитывает время преобразования объектов в этапе serialize
+    RequestTimingMiddleware.
+    """
+
+    def to_representation(self, instance):
+        with measure('serialize'):
+            return super().to_representation(instance)
+
+
+class ImageVariantsMixin:
+    """
+    Добавляет ссылки на уменьшенные копии и WebP-варианты изображения.
+    """
+
+    def get_image_variants(self, recipe):
+        """
+        Ссылки на варианты изображения рецепта recipe
+        или None, пока они не созданы.
+        """
+        urls = get_variant_urls(recipe)
+        request = self.context.get('request')
+        if urls and request is not None:
+            urls = {
+                variant: request.build_absolute_uri(url)
+                for variant, url in urls.items()
+            }
+        return urls
+
+
+class ShortRecipeSerializer(SerializeTimingMixin, ImageVariantsMixin,
+                            ModelSerializer):
     """
     Сериализатор для модели Recipe.
     Определен укороченный набор полей для некоторых эндпоинтов.
     """
+    image_variants = SerializerMethodField()
+
     class Meta:
         model = Recipe
-        fields = 'id', 'name', 'image', 'cooking_time'
+        fields = 'id', 'name', 'image', 'image_variants', 'cooking_time'
         read_only_fields = '__all__',
 
 
-class UserSerializer(ModelSerializer):
+class UserSerializer(SerializeTimingMixin, ModelSerializer):
     """Сериализатор для модели User."""
     is_subscribed = SerializerMethodField()
 
@@ -37,19 +74,24 @@ class UserSerializer(ModelSerializer):
             'first_name',
             'last_name',
             'is_subscribed',
+            'followers_count',
             'password',
         )
         extra_kwargs = {'password': {'write_only': True}}
-        read_only_fields = 'is_subscribed',
+        read_only_fields = 'is_subscribed', 'followers_count',
 
     def get_is_subscribed(self, author):
         """
         Проверка подписан ли текущий пользователь
         на просматриваемого пользователя author.
+        Использует аннотацию из UserViewSet.get_queryset
+        или RecipeViewSet.get_queryset, если она есть.
         """
         user = self.context.get('request').user
         if user.is_anonymous or (user == author):
             return False
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
         return user.follow.filter(id=author.id).exists()
 
     def create(self, validated_data):
@@ -87,7 +129,6 @@ class UserSubscribeSerializer(UserSerializer):
     Сериализатор вывода авторов, на которых подписан текущий пользователь.
     """
     recipes = SerializerMethodField(read_only=True)
-    recipes_count = SerializerMethodField()
 
     class Meta:
         model = User
@@ -98,6 +139,7 @@ class UserSubscribeSerializer(UserSerializer):
             'first_name',
             'last_name',
             'is_subscribed',
+            'followers_count',
             'recipes',
             'recipes_count',
         )
@@ -111,25 +153,22 @@ class UserSubscribeSerializer(UserSerializer):
         """
         return True
 
-    def get_recipes_count(self, author):
-        """
-        Показывает общее количество рецептов у каждого автора author.
-        """
-        return author.recipes.count()
-
     def get_recipes(self, obj):
         """
-        Показывает рецепты авторов в подписках
+        Показывает рецепты авторов в подписках.
+        Использует рецепты, предзагруженные в UserViewSet.subscriptions.
         """
+        if hasattr(obj, 'recent_recipes'):
+            return ShortRecipeSerializer(obj.recent_recipes, many=True).data
         request = self.context.get('request')
         recipes = obj.recipes.all()
-        limit = request.query_params.get('recipes_limit')
-        if limit:
-            recipes = recipes[:int(limit)]
+        limit = get_recipes_limit(request.query_params)
+        if limit is not None:
+            recipes = recipes[:limit]
         return ShortRecipeSerializer(recipes, many=True).data
 
 
-class TagSerializer(ModelSerializer):
+class TagSerializer(SerializeTimingMixin, ModelSerializer):
     """
     Сериализатор для вывода тэгов.
     """
@@ -147,7 +186,7 @@ class TagSerializer(ModelSerializer):
         return f'#{color}'
 
 
-class IngredientSerializer(ModelSerializer):
+class IngredientSerializer(SerializeTimingMixin, ModelSerializer):
     """
     Сериализатор для вывода ингредиентов.
     """
@@ -157,7 +196,8 @@ class IngredientSerializer(ModelSerializer):
         read_only_fields = '__all__',
 
 
-class RecipeSerializer(ModelSerializer):
+class RecipeSerializer(SerializeTimingMixin, ImageVariantsMixin,
+                       ModelSerializer):
     """
     Сериализатор для рецептов.
     """
@@ -166,7 +206,8 @@ class RecipeSerializer(ModelSerializer):
     ingredients = SerializerMethodField()
     is_favorited = SerializerMethodField()
     is_in_shopping_cart = SerializerMethodField()
-    image = Base64ImageField()
+    image = RecipeImageField()
+    image_variants = SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -177,8 +218,10 @@ class RecipeSerializer(ModelSerializer):
             'ingredients',
             'is_favorited',
             'is_in_shopping_cart',
+            'favorites_count',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time',
         )
@@ -188,39 +231,70 @@ class RecipeSerializer(ModelSerializer):
             'is_shopping_cart',
         )
 
+    def to_representation(self, recipe):
+        """
+        Передаёт автору признак подписки, вычисленный
+        в RecipeViewSet.get_queryset.
+        """
+        if hasattr(recipe, 'is_author_subscribed'):
+            recipe.author.is_subscribed = recipe.is_author_subscribed
+        return super().to_representation(recipe)
+
     def get_ingredients(self, recipe):
         """
         Получает список ингредиентов для рецепта recipe.
+        Количество берётся из связанных объектов IngredientAmount
+        именно этого рецепта, предзагруженных в RecipeViewSet.
         """
-        ingredients = recipe.ingredients.values(
-            'id',
-            'name',
-            'measurement_unit',
-            amount=F('recipe__amount')
-        )
-        return ingredients
-
-    def get_is_favorited(self, obj):
+        ingredient_amounts = recipe.ingredient.all()
+        if 'ingredient' not in getattr(
+                recipe, '_prefetched_objects_cache', {}):
+            ingredient_amounts = ingredient_amounts.select_related(
+                'ingredients'
+            ).order_by('ingredients__name')
+        return [
+            {
+                'id': ingredient_amount.ingredients.id,
+                'name': ingredient_amount.ingredients.name,
+                'measurement_unit':
+                    ingredient_amount.ingredients.measurement_unit,
+                'amount': ingredient_amount.amount,
+            }
+            for ingredient_amount in ingredient_amounts
+        ]
+
+    def get_is_favorited(self, recipe):
         """
-        Проверка, находится ли рецепт в избранном.
+        Проверка, находится ли рецепт recipe в избранном.
+        Использует аннотацию из RecipeViewSet.get_queryset,
+        запрос к БД выполняется только при её отсутствии.
         """
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
-        return user.favorites.filter(id=obj.id).exists()
+        if hasattr(recipe, 'is_favorited'):
+            return recipe.is_favorited
+        return user.favorites.filter(id=recipe.id).exists()
 
     def get_is_in_shopping_cart(self, recipe):
         """
-        Проверка, находится ли рецепт recipe в списке покупок."""
+        Проверка, находится ли рецепт recipe в списке покупок.
+        Использует аннотацию из RecipeViewSet.get_queryset,
+        запрос к БД выполняется только при её отсутствии.
+        """
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
+        if hasattr(recipe, 'is_in_shopping_cart'):
+            return recipe.is_in_shopping_cart
         return user.shopping_list.filter(id=recipe.id).exists()
 
     @transaction.atomic
     def validate(self, data):
         """
         Проверка вводных данных data при создании и изменении рецепта.
+        Существование тэгов и ингредиентов проверяется
+        одним запросом для каждой модели.
         """
         name = str(self.initial_data.get('name')).strip()
         tags = self.initial_data.get('tags')
@@ -234,22 +308,23 @@ class RecipeSerializer(ModelSerializer):
                 )
 
         for tag in tags:
-            check_value_validate(tag, Tag)
+            check_value_validate(tag)
+        check_objects_exist(tags, Tag)
 
-        valid_ingredients = []
         for ing in ingredients:
-            ing_id = ing.get('id')
-            ingredient = check_value_validate(ing_id, Ingredient)
-
-            amount = ing.get('amount')
-            check_value_validate(amount)
+            check_value_validate(ing.get('id'))
+            check_value_validate(ing.get('amount'))
+        ingredients_objects = check_objects_exist(
+            [ing['id'] for ing in ingredients], Ingredient
+        )
 
-            valid_ingredients.append(
-                {
-                    'ingredient': ingredient,
-                    'amount': amount,
-                }
-            )
+        valid_ingredients = [
+            {
+                'ingredient': ingredients_objects[int(ing['id'])],
+                'amount': ing['amount'],
+            }
+            for ing in ingredients
+        ]
         if len(valid_ingredients) != len(
                set(obj['ingredient'] for obj in valid_ingredients)):
             raise ValidationError(
@@ -272,32 +347,66 @@ class RecipeSerializer(ModelSerializer):
         recipe = Recipe.objects.create(image=image, **validated_data)
         recipe.tags.set(tags)
         enter_ingredient_amount_in_recipe(recipe, ingredients)
+        image_processor.submit_on_commit(recipe)
         return recipe
 
     @transaction.atomic
     def update(self, recipe, validated_data):
         """
-        Обновление рецепт.
+        Обновление рецепта.
+        Записываются только изменившиеся поля, тэги и ингредиенты.
         """
         tags = validated_data.get('tags')
-        ingredients = validated_data.get('ingredient')
+        ingredients = validated_data.get('ingredients')
 
-        recipe.image = validated_data.get(
-            'image', recipe.image)
-        recipe.name = validated_data.get(
-            'name', recipe.name)
-        recipe.text = validated_data.get(
-            'text', recipe.text)
-        recipe.cooking_time = validated_data.get(
-            'cooking_time', recipe.cooking_time)
+        changed_fields = []
+        for field in ('image', 'name', 'text', 'cooking_time'):
+            if field not in validated_data:
+                continue
+            value = validated_data[field]
+            if getattr(recipe, field) != value:
+                setattr(recipe, field, value)
+                changed_fields.append(field)
 
         if tags:
-            recipe.tags.clear()
             recipe.tags.set(tags)
 
         if ingredients:
-            recipe.ingredients.clear()
-            enter_ingredient_amount_in_recipe(recipe, ingredients)
-
-        recipe.save()
+            update_ingredient_amounts_in_recipe(recipe, ingredients)
+
+        if 'image' in changed_fields:
+            recipe.has_image_variants = False
+            changed_fields.append('has_image_variants')
+        if changed_fields:
+            recipe.save(update_fields=changed_fields)
+        if 'image' in changed_fields:
+            image_processor.submit_on_commit(recipe)
         return recipe
+
+
+class BatchRequestSerializer(Serializer):
+    """
+    Сериализатор одного запроса из пакета для /api/batch/.
+    """
+    BATCH_METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+
+    method = CharField()
+    path = CharField()
+    body = JSONField(required=False)
+
+    def validate_method(self, method):
+        """
+        Проверяет HTTP-метод method, регистр не важен.
+        """
+        method = method.upper()
+        if method not in self.BATCH_METHODS:
+            raise ValidationError(f'Метод {method} не поддерживается.')
+        return method
+
+    def validate_path(self, path):
+        """
+        Разрешены только пути к API.
+        """
+        if not path.startswith('/api/'):
+            raise ValidationError('Путь должен начинаться с /api/.')
+        return path
@@ -1,11 +1,31 @@
 """
 Дополнительные функции.
 """
+import csv
+import heapq
+import json
+from collections import Counter
+from datetime import datetime as dt
+from itertools import groupby, islice
+from operator import itemgetter
 from string import hexdigits
 
+from django.db import connection, transaction
+from django.db.models import (Count, Exists, F, OuterRef, Prefetch, Q,
+                              Subquery, Window, prefetch_related_objects)
+from django.db.models.functions import Coalesce, RowNumber
 from rest_framework.serializers import ValidationError
 
-from recipes.models import IngredientAmount
+from recipes.counters import Favorite, Follow, User, change_counters
+from recipes.models import IngredientAmount, Recipe, ShoppingCartIngredient
+from recipes.services import (ShoppingCart, apply_cart_deltas,
+                              deletion_applied, get_recipe_cart_users,
+                              remove_recipes_from_carts, update_cart_totals)
+
+from .cache import response_cache
+
+TIME_FORMAT = '%d/%m/%Y %H:%M'
+STREAM_CHUNK_SIZE = 500
 
 
 def is_hex_color(value):
@@ -25,21 +45,97 @@ def enter_ingredient_amount_in_recipe(recipe, ingredients):
     Записывает вложенные в рецепт ингредиенты.
     Создает объект IngredientAmount, связывающий объекты Recipe и
     Ingredient с указанием количества ('amount') конкретного ингредиента.
+    Все объекты записываются одним запросом.
     """
-    for ingredient in ingredients:
-        IngredientAmount.objects.get_or_create(
+    IngredientAmount.objects.bulk_create(
+        IngredientAmount(
             recipe=recipe,
             ingredients=ingredient['ingredient'],
             amount=ingredient['amount'],
         )
+        for ingredient in ingredients
+    )
+
+
+def update_ingredient_amounts_in_recipe(recipe, ingredients):
+    """
+    Приводит ингредиенты рецепта recipe к списку ingredients.
+    Сравнивает сохранённые и переданные ингредиенты и удаляет, создаёт
+    и изменяет пакетными запросами только отличающиеся строки.
+    Изменения количеств переносятся в списки покупок с этим рецептом.
+    """
+    stored = {
+        ingredient_amount.ingredients_id: ingredient_amount
+        for ingredient_amount in IngredientAmount.objects.filter(
+            recipe=recipe
+        )
+    }
+    submitted = {
+        ingredient['ingredient'].id: int(ingredient['amount'])
+        for ingredient in ingredients
+    }
+
+    to_delete = [
+        ingredient_amount
+        for ingredient_id, ingredient_amount in stored.items()
+        if ingredient_id not in submitted
+    ]
+    to_create = [
+        IngredientAmount(
+            recipe=recipe, ingredients_id=ingredient_id, amount=amount
+        )
+        for ingredient_id, amount in submitted.items()
+        if ingredient_id not in stored
+    ]
+    to_update = []
+    deltas = {obj.ingredients_id: obj.amount for obj in to_create}
+    deltas.update(
+        (obj.ingredients_id, -obj.amount) for obj in to_delete
+    )
+    for ingredient_id, amount in submitted.items():
+        ingredient_amount = stored.get(ingredient_id)
+        if ingredient_amount and ingredient_amount.amount != amount:
+            deltas[ingredient_id] = amount - ingredient_amount.amount
+            ingredient_amount.amount = amount
+            to_update.append(ingredient_amount)
 
+    # Удаление учтено в deltas, поэтому обработчик post_delete
+    # не обновляет списки покупок для каждой строки.
+    if to_delete:
+        with deletion_applied():
+            IngredientAmount.objects.filter(
+                id__in=[obj.id for obj in to_delete]
+            ).delete()
+    if to_create:
+        IngredientAmount.objects.bulk_create(to_create)
+    if to_update:
+        IngredientAmount.objects.bulk_update(to_update, ('amount',))
+    if deltas:
+        apply_cart_deltas(get_recipe_cart_users(recipe.id), deltas)
+        response_cache.bump(IngredientAmount)
 
-def check_value_validate(value, klass=None):
+
+def delete_recipes(recipes):
     """
-    Проверяет корректность переданного значения.
-    Если передан класс, проверяет, существует ли объект с переданным obj_id.
-    При нахождении объекта создается Queryset[],
-    для дальнейшей работы возвращает первое (и единственное) значение.
+    Удаляет рецепты queryset recipes.
+    Рецепты убираются из списков покупок, а счётчики рецептов авторов
+    уменьшаются пакетными запросами до удаления, поэтому обработчики
+    сигналов не выполняют запросы для каждого рецепта и ингредиента.
+    """
+    with transaction.atomic():
+        authors = Counter(recipes.values_list('author_id', flat=True))
+        remove_recipes_from_carts(recipes)
+        with deletion_applied():
+            recipes.delete()
+        change_counters(User, 'recipes_count', {
+            author_id: -count for author_id, count in authors.items()
+        })
+
+
+def check_value_validate(value):
+    """
+    Проверяет, что значение - целое положительное число.
+    Существование объектов проверяет check_objects_exist.
     """
     if not str(value).isdecimal():
         raise ValidationError(
@@ -49,10 +145,335 @@ def check_value_validate(value, klass=None):
         raise ValidationError(
             'Количество ингредиента должно быть больше 0'
         )
-    if klass:
-        obj = klass.objects.filter(id=value)
-        if not obj:
-            raise ValidationError(
-                f'{value} не существует'
+
+
+def check_objects_exist(values, klass):
+    """
+    Проверяет одним запросом, что существуют объекты klass
+    со всеми id из values, и сообщает сразу обо всех отсутствующих.
+    Возвращает словарь {id: объект}.
+    """
+    ids = [int(value) for value in values]
+    objects = klass.objects.in_bulk(ids)
+    missing = [str(obj_id) for obj_id in ids if obj_id not in objects]
+    if missing:
+        raise ValidationError(
+            f'{", ".join(missing)} не существует'
+        )
+    return objects
+
+
+def get_recent_recipes(recipes, limit, oldest_first=False):
+    """
+    Возвращает не более limit последних рецептов каждого автора
+    из выборки recipes, при oldest_first=True - не более limit
+    самых ранних.
+    Если БД поддерживает оконные функции, рецепты нумеруются через
+    ROW_NUMBER() OVER (PARTITION BY author_id), иначе для каждого рецепта
+    считается количество более новых рецептов того же автора.
+    """
+    if connection.features.supports_over_clause:
+        ordering = (F('create_data'), F('id'))
+        ranked = recipes.annotate(
+            row_number=Window(
+                expression=RowNumber(),
+                partition_by=(F('author_id'),),
+                order_by=tuple(
+                    field.asc() if oldest_first else field.desc()
+                    for field in ordering
+                ),
             )
-        return obj[0]
+        ).order_by().values('id', 'row_number')
+        sql, params = ranked.query.sql_with_params()
+        quote = connection.ops.quote_name
+        return Recipe.objects.extra(
+            where=(
+                f'{quote(Recipe._meta.db_table)}.{quote("id")} IN ('
+                f'SELECT {quote("id")} FROM ({sql}) {quote("ranked")} '
+                f'WHERE {quote("row_number")} <= %s)',
+            ),
+            params=(*params, limit),
+        )
+
+    lookup = 'lt' if oldest_first else 'gt'
+    preceding = recipes.filter(
+        Q(**{f'create_data__{lookup}': OuterRef('create_data')})
+        | Q(create_data=OuterRef('create_data'),
+            **{f'id__{lookup}': OuterRef('id')}),
+        author_id=OuterRef('author_id'),
+    ).order_by().values('author_id').annotate(
+        count=Count('id')
+    ).values('count')
+    return recipes.annotate(
+        preceding_count=Coalesce(Subquery(preceding), 0)
+    ).filter(preceding_count__lt=limit)
+
+
+def merge_recent_recipes(recipes, limit, oldest_first=False):
+    """
+    Возвращает id не более limit последних (при oldest_first - самых
+    ранних) рецептов из выборки recipes.
+    Для каждого автора выбирается не более limit рецептов, и эти списки
+    сливаются через heapq.merge, поэтому объём работы ограничен
+    количеством авторов и не зависит от общего числа их рецептов.
+    """
+    recipes = recipes.select_related(None).prefetch_related(None)
+    rows = get_recent_recipes(recipes, limit, oldest_first).order_by(
+        'author_id',
+        *(('create_data', 'id') if oldest_first else ('-create_data', '-id'))
+    ).values_list('author_id', 'create_data', 'id')
+    per_author = (
+        [(create_data, recipe_id) for _, create_data, recipe_id in group]
+        for _, group in groupby(rows, key=itemgetter(0))
+    )
+    merged = heapq.merge(*per_author, reverse=not oldest_first)
+    return [recipe_id for _, recipe_id in islice(merged, limit)]
+
+
+def get_recipes_limit(query_params):
+    """
+    Значение параметра `recipes_limit` или None, если он не передан.
+    При 0 рецепты не выводятся, отрицательные и нечисловые
+    значения не допускаются.
+    """
+    limit = query_params.get('recipes_limit')
+    if not limit:
+        return None
+    if not limit.isdecimal():
+        raise ValidationError({
+            'recipes_limit': 'Должно быть неотрицательным целым числом.'
+        })
+    return int(limit)
+
+
+def prefetch_recent_recipes(authors, limit=None):
+    """
+    Одним запросом загружает рецепты авторов authors
+    в атрибут `recent_recipes`.
+    При переданном limit для каждого автора загружается
+    не более limit последних рецептов.
+    """
+    recipes = Recipe.objects.all()
+    if limit == 0:
+        recipes = Recipe.objects.none()
+    elif limit is not None:
+        recipes = get_recent_recipes(
+            Recipe.objects.filter(author__in=authors), limit
+        )
+    prefetch_related_objects(
+        authors,
+        Prefetch('recipes', queryset=recipes, to_attr='recent_recipes'),
+    )
+
+
+def annotate_recipe_flags(queryset, user):
+    """
+    Добавляет к рецептам queryset признаки избранного, списка покупок
+    пользователя user и подписки на автора подзапросами EXISTS.
+    """
+    return queryset.annotate(
+        is_favorited=Exists(Favorite.objects.filter(
+            recipe_id=OuterRef('pk'), user_id=user.id
+        )),
+        is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+            recipe_id=OuterRef('pk'), user_id=user.id
+        )),
+        is_author_subscribed=Exists(Follow.objects.filter(
+            from_user_id=user.id, to_user_id=OuterRef('author_id')
+        )),
+    )
+
+
+def set_recipe_flags(recipes, user):
+    """
+    Одним запросом задаёт уже выбранным рецептам recipes признаки
+    из annotate_recipe_flags. Подзапросы выполняются только для
+    рецептов страницы, а не для всей выборки.
+    """
+    flags = {
+        recipe_id: values for recipe_id, *values in annotate_recipe_flags(
+            Recipe.objects.filter(pk__in=[recipe.pk for recipe in recipes]),
+            user,
+        ).values_list(
+            'pk', 'is_favorited', 'is_in_shopping_cart',
+            'is_author_subscribed',
+        ).order_by()
+    }
+    for recipe in recipes:
+        (recipe.is_favorited, recipe.is_in_shopping_cart,
+         recipe.is_author_subscribed) = flags[recipe.pk]
+
+
+def get_shopping_cart_ingredients(user):
+    """
+    Возвращает суммы ингредиентов из списка покупок пользователя user.
+    Суммы заранее поддерживаются в таблице ShoppingCartIngredient,
+    поэтому это чтение по индексу без агрегации.
+    Результат читается частями (на PostgreSQL - серверным курсором).
+    """
+    return ShoppingCartIngredient.objects.filter(user=user).values(
+        'amount',
+        name=F('ingredient__name'),
+        measurement_unit=F('ingredient__measurement_unit'),
+    ).order_by('name', 'measurement_unit').iterator(
+        chunk_size=STREAM_CHUNK_SIZE
+    )
+
+
+def _join_in_chunks(lines):
+    """
+    Склеивает строки lines в куски по STREAM_CHUNK_SIZE строк,
+    чтобы не отправлять клиенту каждую строку отдельно.
+    """
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= STREAM_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def _shopping_list_txt(user, ingredients):
+    yield f'Список покупок для пользователя {user.first_name}:\n\n'
+    for ing in ingredients:
+        yield f"{ing['name']}: {ing['amount']}{ing['measurement_unit']}\n"
+    yield (
+        f'\nДата составления {dt.now().strftime(TIME_FORMAT)}.'
+        '\n\nMade in Foodgram 2022 (c)'
+    )
+
+
+class _Echo:
+    """
+    Псевдо-файл для csv.writer, возвращающий записанную строку.
+    """
+    def write(self, value):
+        return value
+
+
+def _shopping_list_csv(user, ingredients):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ing in ingredients:
+        yield writer.writerow(
+            (ing['name'], ing['measurement_unit'], ing['amount'])
+        )
+
+
+def _shopping_list_json(user, ingredients):
+    separator = '['
+    for ing in ingredients:
+        yield separator + json.dumps(
+            {
+                'name': ing['name'],
+                'measurement_unit': ing['measurement_unit'],
+                'amount': ing['amount'],
+            },
+            ensure_ascii=False,
+        )
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': _shopping_list_txt,
+    'csv': _shopping_list_csv,
+    'json': _shopping_list_json,
+}
+
+
+def stream_shopping_list(user, file_format):
+    """
+    Генератор файла со списком покупок пользователя user
+    в формате file_format (txt, csv или json).
+    """
+    return _join_in_chunks(SHOPPING_LIST_FORMATS[file_format](
+        user, get_shopping_cart_ingredients(user)
+    ))
+
+
+def filter_by_tags(queryset, tags, mode=None):
+    """
+    Фильтрует рецепты queryset по слагам тэгов tags подзапросом IN
+    к таблице связи рецептов и тэгов, без JOIN, DISTINCT и аннотаций:
+    COUNT(*) пагинатора остаётся простым.
+    В режиме mode='all' рецепт должен иметь все тэги,
+    иначе - хотя бы один из них.
+    """
+    recipe_tags = Recipe.tags.through.objects.filter(tag__slug__in=tags)
+    if mode == 'all':
+        recipe_tags = recipe_tags.values('recipe_id').annotate(
+            matched=Count('tag_id')
+        ).filter(matched=len(set(tags))).order_by()
+    return queryset.filter(pk__in=recipe_tags.values('recipe_id'))
+
+
+# Связи пользователя, которые переключаются кнопками:
+# таблица связей, столбцы пользователя и объекта, модель объекта
+# и её счётчик.
+RELATIONS = {
+    'follow_M2M': (
+        Follow, 'from_user_id', 'to_user_id', User, 'followers_count'
+    ),
+    'is_favorite_M2M': (
+        Favorite, 'user_id', 'recipe_id', Recipe, 'favorites_count'
+    ),
+    'shopping_cart_M2M': (
+        ShoppingCart, 'user_id', 'recipe_id', Recipe, 'in_carts_count'
+    ),
+}
+
+
+def _apply_relation_change(relation, user_id, obj_id, sign):
+    """
+    Обновляет то, что при изменении связи через менеджер делают
+    обработчики m2m_changed: счётчик объекта и суммы в списке покупок.
+    """
+    _, _, _, model, counter = RELATIONS[relation]
+    change_counters(model, counter, {obj_id: sign})
+    if relation == 'shopping_cart_M2M':
+        update_cart_totals([user_id], [obj_id], sign)
+
+
+def add_relation(relation, user_id, obj_id):
+    """
+    Создаёт связь пользователя user_id с объектом obj_id одним запросом
+    INSERT ... SELECT ... ON CONFLICT DO NOTHING.
+    Возвращает True, если связь создана, и False, если она уже была
+    или объекта нет. Одновременные повторные запросы не создают дублей.
+    """
+    through, user_column, obj_column, model, _ = RELATIONS[relation]
+    ops = connection.ops
+    quote = ops.quote_name
+    pk = quote(model._meta.pk.column)
+    sql = (
+        f'{ops.insert_statement(ignore_conflicts=True)} '
+        f'{quote(through._meta.db_table)} '
+        f'({quote(user_column)}, {quote(obj_column)}) '
+        f'SELECT %s, {pk} FROM {quote(model._meta.db_table)} '
+        f'WHERE {pk} = %s '
+        f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}'
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(sql, (user_id, obj_id))
+        created = cursor.rowcount > 0
+        if created:
+            _apply_relation_change(relation, user_id, obj_id, 1)
+    return created
+
+
+def remove_relation(relation, user_id, obj_id):
+    """
+    Удаляет связь пользователя user_id с объектом obj_id одним DELETE.
+    Возвращает True, если связь была.
+    """
+    through, user_column, obj_column, _, _ = RELATIONS[relation]
+    with transaction.atomic():
+        deleted, _ = through.objects.filter(
+            **{user_column: user_id, obj_column: obj_id}
+        ).delete()
+        if deleted:
+            _apply_relation_change(relation, user_id, obj_id, -1)
+    return bool(deleted)
@@ -0,0 +1,86 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, IngredientAmount, Recipe, Tag
+
+from .cache import response_cache, token_cache
+
+User = get_user_model()
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=IngredientAmount)
+def bump_cache_version(sender, **kwargs):
+    """
+    Сбрасывает закэшированные ответы, зависящие от модели sender.
+    """
+    response_cache.bump(sender)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipe_cache_version(action, **kwargs):
+    """
+    Сбрасывает закэшированные рецепты при изменении их тэгов.
+    """
+    if action.startswith('post_'):
+        response_cache.bump(Recipe)
+
+
+# Поля пользователя, которые выводятся в рецептах в данных автора.
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+
+@receiver(pre_save, sender=User)
+def check_author_fields(instance, raw, update_fields=None, **kwargs):
+    """
+    Запоминает, изменились ли поля пользователя, которые выводятся
+    в рецептах. Сохранённые значения читаются, только если эти поля
+    записываются, поэтому вход и смена пароля их не читают.
+    """
+    instance._author_fields_changed = False
+    fields = AUTHOR_FIELDS
+    if update_fields is not None:
+        fields = [field for field in fields if field in update_fields]
+    if raw or instance._state.adding or not fields:
+        return
+    stored = User.objects.filter(pk=instance.pk).values(*fields).first()
+    instance._author_fields_changed = stored is not None and any(
+        stored[field] != getattr(instance, field) for field in fields
+    )
+
+
+@receiver(post_save, sender=User)
+def bump_author_cache_version(instance, **kwargs):
+    """
+    Сбрасывает закэшированные рецепты при изменении данных автора.
+    Счётчик подписчиков сбрасывает их в recipes.counters.
+    """
+    if getattr(instance, '_author_fields_changed', False):
+        response_cache.bump(Recipe)
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(instance, **kwargs):
+    """
+    Удаляет токен из кэша аутентификации, в том числе при выходе.
+    """
+    token_cache.delete([instance.key])
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(instance, update_fields=None, **kwargs):
+    """
+    Удаляет из кэша аутентификации токены пользователя при изменении
+    его данных: смене пароля, деактивации и т.д.
+    Обновление только даты последнего входа не учитывается.
+    """
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    token_cache.delete(
+        Token.objects.filter(user=instance).values_list('key', flat=True)
+    )
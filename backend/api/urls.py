@@ -1,7 +1,8 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+from .views import (BatchView, IngredientViewSet, RecipeViewSet, TagViewSet,
+                    UserViewSet)
 
 app_name = 'api'
 
@@ -12,6 +13,7 @@ router.register('recipes', RecipeViewSet, 'recipes')
 router.register('users', UserViewSet, 'users')
 
 urlpatterns = (
+    path('batch/', BatchView.as_view(), name='batch'),
     path('', include(router.urls)),
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
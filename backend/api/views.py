@@ -1,23 +1,39 @@
-from datetime import datetime as dt
-from urllib.parse import unquote
+import json
+from io import BytesIO
+from urllib.parse import unquote, urlsplit
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import F, Sum
-from django.http.response import HttpResponse
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch
+from django.http.response import StreamingHttpResponse
+from django.urls import Resolver404, resolve
 from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_401_UNAUTHORIZED
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
 from recipes.models import Ingredient, IngredientAmount, Recipe, Tag
+from recipes.search import ingredient_search
 
-from .mixins import AddDelViewMixin
-from .paginators import PageLimitPagination
+from .fast_serializers import FastRecipeSerializer, FastUserSubscribeSerializer
+from .mixins import AddDelViewMixin, ResponseCacheMixin
+from .paginators import KeysetPagination, PageLimitPagination
 from .permissions import IsAdminOrReadOnly, IsAuthorStaffOrReadOnly
-from .serializers import (IngredientSerializer, RecipeSerializer,
-                          ShortRecipeSerializer, TagSerializer,
-                          UserSubscribeSerializer)
+from .renderers import CSVRenderer, PlainTextRenderer
+from .serializers import (BatchRequestSerializer, IngredientSerializer,
+                          RecipeSerializer, ShortRecipeSerializer,
+                          TagSerializer, UserSubscribeSerializer)
+from .services import (annotate_recipe_flags, delete_recipes, filter_by_tags,
+                       get_recipes_limit, merge_recent_recipes,
+                       prefetch_recent_recipes, set_recipe_flags,
+                       stream_shopping_list)
 
 User = get_user_model()
 
@@ -30,8 +46,52 @@ class UserViewSet(DjoserUserViewSet, AddDelViewMixin):
     подписаться на автора рецепта.
     """
     pagination_class = PageLimitPagination
+    keyset_ordering = ('username', 'id')
     add_serializer = UserSubscribeSerializer
 
+    def get_permissions(self):
+        """
+        Профиль текущего пользователя (`users/me/`) доступен только
+        авторизованным: права 'user' из настроек djoser разрешают
+        чтение всем, и анонимный запрос завершался ошибкой сервера.
+        """
+        if self.action == 'me':
+            return (IsAuthenticated(),)
+        return super().get_permissions()
+
+    def get_queryset(self):
+        """
+        Для авторизованного пользователя признак подписки
+        на пользователей вычисляется подзапросом EXISTS.
+        """
+        queryset = super().get_queryset()
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset
+        return queryset.annotate(
+            is_subscribed=Exists(
+                User.follow.through.objects.filter(
+                    from_user_id=user.id, to_user_id=OuterRef('pk')
+                )
+            )
+        )
+
+    def get_instance(self):
+        """
+        Профиль текущего пользователя (`users/me/`) читается из БД:
+        пользователь из кэша токенов может быть с устаревшими счётчиками.
+        """
+        return User.objects.get(pk=self.request.user.pk)
+
+    def perform_destroy(self, instance):
+        """
+        Рецепты пользователя удаляются пакетно (delete_recipes)
+        до каскадного удаления.
+        """
+        with transaction.atomic():
+            delete_recipes(instance.recipes.all())
+            super().perform_destroy(instance)
+
     @action(methods=('GET', 'POST', 'DELETE',), detail=True)
     def subscribe(self, request, id):
         """Создаёт/удалет связь между пользователями.
@@ -47,15 +107,24 @@ class UserViewSet(DjoserUserViewSet, AddDelViewMixin):
         user = self.request.user
         if user.is_anonymous:
             return Response(status=HTTP_401_UNAUTHORIZED)
+        limit = get_recipes_limit(request.query_params)
         authors = user.follow.all()
         pages = self.paginate_queryset(authors)
-        serializer = UserSubscribeSerializer(
-            pages, many=True, context={'request': request}
+        if pages is not None:
+            authors = pages
+        prefetch_recent_recipes(authors, limit)
+        serializer_class = UserSubscribeSerializer
+        if settings.FAST_READ_SERIALIZERS:
+            serializer_class = FastUserSubscribeSerializer
+        serializer = serializer_class(
+            authors, many=True, context={'request': request}
         )
+        if pages is None:
+            return Response(serializer.data)
         return self.get_paginated_response(serializer.data)
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class TagViewSet(ResponseCacheMixin, ReadOnlyModelViewSet):
     """
     Работает с тэгами.
     Изменение и создание тэгов разрешено только админам.
@@ -63,9 +132,10 @@ class TagViewSet(ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsAdminOrReadOnly,)
+    cache_models = (Tag,)
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(ResponseCacheMixin, ReadOnlyModelViewSet):
     """
     Работает с ингредиентами.
     Изменение и создание ингредиентов разрешено только админам.
@@ -73,12 +143,15 @@ class IngredientViewSet(ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAdminOrReadOnly,)
+    cache_models = (Ingredient,)
 
     def get_queryset(self):
         """
         Получает queryset в соответствии с параметрами запроса.
         Ищет объекты по совпадению в начале названия,
         также добавляются результаты по совпадению в середине.
+        Поиск выполняется выбранным в INGREDIENT_SEARCH_BACKEND способом:
+        по индексу в памяти или запросом к БД.
         Прописные буквы преобразуются в строчные,
         так как все ингредиенты в базе даны в нижнем регистре.
         """
@@ -88,16 +161,13 @@ class IngredientViewSet(ReadOnlyModelViewSet):
             if name[0] == '%':
                 name = unquote(name)
             name = name.lower()
-            stw_queryset = list(queryset.filter(name__startswith=name))
-            cnt_queryset = queryset.filter(name__contains=name)
-            stw_queryset.extend(
-                [i for i in cnt_queryset if i not in stw_queryset]
+            queryset = ingredient_search.search(
+                name, settings.INGREDIENT_SEARCH_LIMIT
             )
-            queryset = stw_queryset
         return queryset
 
 
-class RecipeViewSet(ModelViewSet, AddDelViewMixin):
+class RecipeViewSet(ResponseCacheMixin, ModelViewSet, AddDelViewMixin):
     """
     Работает с рецептами.
     Вывод, создание, редактирование, добавление/удаление
@@ -107,21 +177,51 @@ class RecipeViewSet(ModelViewSet, AddDelViewMixin):
     рецепт в избранное и в список покупок.
     Изменять рецепт может только автор или админ.
     """
-    queryset = Recipe.objects.select_related('author')
+    queryset = Recipe.objects.select_related('author').prefetch_related(
+        'tags',
+        Prefetch(
+            'ingredient',
+            queryset=IngredientAmount.objects.select_related(
+                'ingredients'
+            ).order_by('ingredients__name'),
+        ),
+    )
     serializer_class = RecipeSerializer
     permission_classes = (IsAuthorStaffOrReadOnly,)
     pagination_class = PageLimitPagination
+    keyset_ordering = ('-create_data', '-id')
     add_serializer = ShortRecipeSerializer
+    cache_models = (Recipe, Tag, Ingredient, IngredientAmount)
+
+    def get_serializer_class(self):
+        """
+        При FAST_READ_SERIALIZERS рецепты для чтения (list, retrieve, feed)
+        выводятся FastRecipeSerializer.
+        """
+        if (settings.FAST_READ_SERIALIZERS
+                and self.request.method == 'GET'
+                and self.action in ('list', 'retrieve', 'feed')):
+            return FastRecipeSerializer
+        return super().get_serializer_class()
 
     def get_queryset(self):
         """
         Фильтрация в соответствии с параметрами запроса.
+        Параметр `tags_mode=all` оставляет рецепты со всеми
+        переданными тэгами, по умолчанию (`any`) - хотя бы с одним.
+        Избранное и список покупок фильтруются подзапросом IN.
+        Признаки `is_favorited`, `is_in_shopping_cart` и подписки
+        на автора добавляются подзапросами EXISTS, кроме постраничного
+        списка: там они задаются только рецептам страницы
+        (paginate_queryset), чтобы COUNT(*) пагинатора обходился
+        без подзапросов.
         """
         queryset = self.queryset
         tags = self.request.query_params.getlist('tags')
         if tags:
-            queryset = queryset.filter(
-                tags__slug__in=tags).distinct()
+            queryset = filter_by_tags(
+                queryset, tags, self.request.query_params.get('tags_mode')
+            )
 
         author = self.request.query_params.get('author')
         if author:
@@ -132,19 +232,56 @@ class RecipeViewSet(ModelViewSet, AddDelViewMixin):
         if user.is_anonymous:
             return queryset
 
+        in_shopping_list = Recipe.is_in_shopping_list.through.objects.filter(
+            user_id=user.id
+        ).values('recipe_id')
         is_in_shopping = self.request.query_params.get('is_in_shopping_cart')
         if is_in_shopping in ('1', 'true',):
-            queryset = queryset.filter(is_in_shopping_list=user.id)
+            queryset = queryset.filter(pk__in=in_shopping_list)
         elif is_in_shopping in ('0', 'false',):
-            queryset = queryset.exclude(is_in_shopping_list=user.id)
+            queryset = queryset.exclude(pk__in=in_shopping_list)
 
+        favorites = Recipe.is_favorite.through.objects.filter(
+            user_id=user.id
+        ).values('recipe_id')
         is_favorited = self.request.query_params.get('is_favorited')
         if is_favorited in ('1', 'true',):
-            queryset = queryset.filter(is_favorite=user.id)
+            queryset = queryset.filter(pk__in=favorites)
         if is_favorited in ('0', 'false',):
-            queryset = queryset.exclude(is_favorite=user.id)
+            queryset = queryset.exclude(pk__in=favorites)
 
-        return queryset
+        if self.is_page_counted():
+            return queryset
+        return annotate_recipe_flags(queryset, user)
+
+    def is_page_counted(self):
+        """
+        Выводится ли список постранично с подсчётом COUNT(*):
+        с параметром `limit` и без `cursor`.
+        """
+        paginator = self.paginator
+        return (
+            self.action == 'list'
+            and paginator is not None
+            and paginator.keyset_class.cursor_query_param
+            not in self.request.query_params
+            and paginator.get_page_size(self.request) is not None
+        )
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        user = self.request.user
+        if page is not None and user.is_authenticated and (
+                self.is_page_counted()):
+            set_recipe_flags(page, user)
+        return page
+
+    def perform_destroy(self, instance):
+        """
+        Рецепт удаляется через delete_recipes: списки покупок
+        и счётчик автора обновляются пакетными запросами.
+        """
+        delete_recipes(Recipe.objects.filter(pk=instance.pk))
 
     @action(methods=('GET', 'POST', 'DELETE',), detail=True)
     def favorite(self, request, pk):
@@ -161,49 +298,151 @@ class RecipeViewSet(ModelViewSet, AddDelViewMixin):
         return self.add_remove_relation(pk, 'shopping_cart_M2M')
 
     @action(methods=('get',), detail=False)
+    def feed(self, request):
+        """
+        Последние рецепты авторов, на которых подписан пользователь.
+        */recipes/feed/?cursor=...&limit=...
+        Выборка идёт по индексу (author_id, create_data) с пагинацией
+        по ключу. При подписке на большое количество авторов
+        (больше FEED_MERGE_THRESHOLD) для каждого автора берётся
+        не больше страницы рецептов, и эти списки сливаются.
+        """
+        user = self.request.user
+        if user.is_anonymous:
+            return Response(status=HTTP_401_UNAUTHORIZED)
+        paginator = KeysetPagination()
+        queryset = paginator.filter_queryset(
+            self.get_queryset().filter(author__in=user.follow.values('id')),
+            request,
+            view=self,
+        )
+        if user.follow.count() > settings.FEED_MERGE_THRESHOLD:
+            queryset = queryset.filter(id__in=merge_recent_recipes(
+                queryset, paginator.page_size + 1, paginator.reverse
+            ))
+        page = paginator.get_page(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(
+        methods=('get',),
+        detail=False,
+        renderer_classes=(PlainTextRenderer, CSVRenderer, JSONRenderer),
+    )
     def download_shopping_cart(self, request):
         """
-        Загружает файл *.txt со списком покупок
+        Загружает файл со списком покупок.
+        Формат выбирается параметром `?format=txt|csv|json`,
+        по умолчанию - *.txt.
+        Файл формируется и отправляется потоком по мере чтения из БД.
         """
-        TIME_FORMAT = '%d/%m/%Y %H:%M'
         user = self.request.user
+        if user.is_anonymous:
+            return Response(status=HTTP_401_UNAUTHORIZED)
         if not user.shopping_list.exists():
             return Response(status=HTTP_400_BAD_REQUEST)
-        ingredients = IngredientAmount.objegicts.filter(
-            recipe__in=(user.shopping_list.values('id'))
-        ).values(
-            name=F('ingredients__name'),
-            measure=F('ingredients__measurement_unit')
-        ).annotate(amount=Sum('amount'))
-
-        filename = f'{user.username}_shopping_list.txt'
-        shopping_list = (f'Список покупок для пользователя '
-                         f'{user.first_name}:\n\n')
-        ingredients_set = {}
-        for ing in ingredients:
-            name = ing['name']
-            amount = ing['amount']
-            measure = ing['measure']
-            if name not in ingredients_set:
-                ingredients_set[name] = {
-                    'amount': amount,
-                    'measure': measure,
-                }
-            else:
-                ingredients_set[name]['amount'] += amount
-
-        for name in ingredients_set:
-            shopping_list += (f"{name}: "
-                              f"{ingredients_set[name]['amount']}"
-                              f"{ingredients_set[name]['measure']}\n")
-
-        shopping_list += (
-            f'\nДата составления {dt.now().strftime(TIME_FORMAT)}.'
-            '\n\nMade in Foodgram 2022 (c)'
-        )
 
-        response = HttpResponse(
-            shopping_list, content_type='text.txt; charset=utf-8'
+        renderer = request.accepted_renderer
+        filename = f'{user.username}_shopping_list.{renderer.format}'
+        response = StreamingHttpResponse(
+            stream_shopping_list(user, renderer.format),
+            content_type=f'{renderer.media_type}; charset=utf-8',
         )
         response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
+
+
+class BatchView(APIView):
+    """
+    Выполняет несколько запросов к API за один HTTP-запрос.
+    Принимает список запросов `[{"method", "path", "body"}, ...]`
+    или объект `{"requests": [...], "atomic": true}` и возвращает
+    список ответов `[{"status", "body"}, ...]` в том же порядке.
+    Запросы выполняются по очереди внутри процесса теми же
+    представлениями, пользователь определяется один раз для всего пакета.
+    При `atomic` все запросы выполняются в одной транзакции: после
+    первого ответа с ошибкой она откатывается, а остальные запросы
+    не выполняются и получают статус 424.
+    """
+    permission_classes = (AllowAny,)
+
+    def post(self, request):
+        items, atomic = request.data, False
+        if isinstance(items, dict):
+            atomic = bool(items.get('atomic', False))
+            items = items.get('requests')
+        if isinstance(items, list) and len(items) > (
+                settings.BATCH_MAX_REQUESTS):
+            raise ValidationError(
+                f'В пакете не больше {settings.BATCH_MAX_REQUESTS} запросов.'
+            )
+        serializer = BatchRequestSerializer(data=items, many=True)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data
+
+        if not atomic:
+            return Response([
+                self.dispatch_item(request, item) for item in items
+            ])
+        responses = []
+        with transaction.atomic():
+            for item in items:
+                responses.append(self.dispatch_item(request, item))
+                if responses[-1]['status'] >= 400:
+                    transaction.set_rollback(True)
+                    break
+        responses += [
+            {'status': 424, 'body': None}
+            for _ in items[len(responses):]
+        ]
+        return Response(responses)
+
+    def dispatch_item(self, request, item):
+        """
+        Выполняет один запрос item от имени пользователя запроса request.
+        """
+        url = urlsplit(item['path'])
+        path = unquote(url.path)
+        try:
+            match = resolve(path)
+        except Resolver404:
+            return {'status': 404, 'body': {'detail': 'Страница не найдена.'}}
+        if getattr(match.func, 'view_class', None) is type(self):
+            return {
+                'status': 400,
+                'body': {'detail': 'Вложенные пакеты не поддерживаются.'},
+            }
+
+        body = b''
+        if 'body' in item:
+            body = json.dumps(item['body']).encode()
+        environ = dict(
+            request.META,
+            REQUEST_METHOD=item['method'],
+            # Строки окружения WSGI - байты в кодировке latin-1.
+            PATH_INFO=path.encode().decode('iso-8859-1'),
+            QUERY_STRING=url.query.encode().decode('iso-8859-1'),
+            CONTENT_TYPE='application/json',
+            CONTENT_LENGTH=str(len(body)),
+        )
+        environ['wsgi.input'] = BytesIO(body)
+        subrequest = WSGIRequest(environ)
+        if request.user.is_authenticated:
+            # Так же, как rest_framework.test.force_authenticate:
+            # вложенный запрос не проходит аутентификацию повторно.
+            subrequest._force_auth_user = request.user
+            subrequest._force_auth_token = request.auth
+
+        response = match.func(subrequest, *match.args, **match.kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        content = (
+            b''.join(response.streaming_content) if response.streaming
+            else response.content
+        )
+        if content and response.get('Content-Type', '').startswith(
+                'application/json'):
+            content = json.loads(content)
+        else:
+            content = content.decode() or None
+        return {'status': response.status_code, 'body': content}
@@ -0,0 +1,219 @@
+"""
+Замер времени обработки запросов и количества SQL-запросов.
+"""
+import logging
+import re
+from collections import defaultdict
+from contextlib import ExitStack
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('foodgram.timing')
+slow_logger = logging.getLogger('foodgram.timing.slow')
+
+_current = ContextVar('request_timing', default=None)
+
+IN_LIST = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+NUMBER = re.compile(r'\b\d+\b')
+
+# Этапы в порядке вывода в заголовке Server-Timing.
+PHASES = ('resolve', 'view', 'serialize', 'render', 'sql')
+
+
+def normalize_sql(sql):
+    """
+    Приводит запросы, отличающиеся только числом параметров в IN
+    и числами в тексте (LIMIT, OFFSET), к одному виду.
+    """
+    return NUMBER.sub('N', IN_LIST.sub('(...)', sql))
+
+
+class RequestTiming:
+    """
+    Длительности этапов одного запроса в секундах и статистика
+    SQL-запросов {текст запроса: [количество, длительность]}.
+    """
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.durations = defaultdict(float)
+        self.queries = defaultdict(lambda: [0, 0.0])
+        self.active = set()
+        self.view_name = None
+        self.view_start = None
+        self.render_start = None
+
+    def execute(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = perf_counter() - start
+            self.durations['sql'] += duration
+            stats = self.queries[sql]
+            stats[0] += 1
+            stats[1] += duration
+
+    def finish(self):
+        end = perf_counter()
+        self.durations['total'] = end - self.start
+        if self.view_start is None:
+            return
+        self.durations['resolve'] = self.view_start - self.start
+        view_end = end if self.render_start is None else self.render_start
+        self.durations['view'] = view_end - self.view_start
+        if self.render_start is not None:
+            self.durations['render'] = end - self.render_start
+
+    @property
+    def query_count(self):
+        return sum(count for count, _ in self.queries.values())
+
+    def get_normalized_queries(self):
+        """
+        Список (количество, длительность, запрос) по убыванию количества.
+        """
+        queries = defaultdict(lambda: [0, 0.0])
+        for sql, (count, duration) in self.queries.items():
+            stats = queries[normalize_sql(sql)]
+            stats[0] += count
+            stats[1] += duration
+        return sorted(
+            ((count, duration, sql)
+             for sql, (count, duration) in queries.items()),
+            reverse=True,
+        )
+
+
+class measure:
+    """
+    Контекстный менеджер, добавляющий длительность блока к этапу name
+    текущего запроса. Вложенные блоки одного этапа учитываются один раз.
+    Без RequestTimingMiddleware ничего не делает.
+    """
+    __slots__ = ('name', 'timing', 'start')
+
+    def __init__(self, name):
+        self.name = name
+        self.timing = _current.get()
+
+    def __enter__(self):
+        if self.timing is not None:
+            if self.name in self.timing.active:
+                self.timing = None
+            else:
+                self.timing.active.add(self.name)
+                self.start = perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.timing is not None:
+            self.timing.durations[self.name] += perf_counter() - self.start
+            self.timing.active.discard(self.name)
+
+
+class RequestTimingMiddleware:
+    """
+    Считает SQL-запросы и время этапов обработки запроса:
+    - resolve - до вызова представления (middleware и разбор URL);
+    - view - работа представления;
+    - serialize - преобразование объектов сериализаторами
+      (входит в view, включает их SQL-запросы);
+    - render - формирование тела ответа;
+    - sql - все SQL-запросы.
+    Результат добавляется в заголовок Server-Timing и пишется в лог
+    foodgram.timing, запросы дольше SLOW_REQUEST_MS или с количеством
+    SQL-запросов больше SLOW_REQUEST_QUERIES - в лог foodgram.timing.slow
+    вместе со сгруппированными SQL-запросами.
+    При REQUEST_TIMING_ENABLED = False не подключается.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing = RequestTiming()
+        request.timing = timing
+        token = _current.set(timing)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(timing.execute)
+                    )
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        timing.finish()
+        response['Server-Timing'] = self.get_server_timing(timing)
+        self.log(request, response, timing)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.timing.view_start = perf_counter()
+        request.timing.view_name = self.get_view_name(request, view_func)
+
+    def process_template_response(self, request, response):
+        request.timing.render_start = perf_counter()
+        return response
+
+    @staticmethod
+    def get_view_name(request, view_func):
+        """
+        Имя представления, для ViewSet - с именем действия:
+        RecipeViewSet.list, UserViewSet.subscribe.
+        """
+        view_class = getattr(
+            view_func, 'cls', getattr(view_func, 'view_class', None)
+        )
+        if view_class is None:
+            return f'{view_func.__module__}.{view_func.__name__}'
+        actions = getattr(view_func, 'actions', None)
+        if actions:
+            action = actions.get(request.method.lower(), request.method)
+            return f'{view_class.__name__}.{action}'
+        return view_class.__name__
+
+    @staticmethod
+    def get_server_timing(timing):
+        metrics = [
+            f'{name};dur={timing.durations[name] * 1000:.1f}'
+            for name in PHASES if name in timing.durations
+        ]
+        metrics.append(f'queries;desc="{timing.query_count}"')
+        metrics.append(f'total;dur={timing.durations["total"] * 1000:.1f}')
+        return ', '.join(metrics)
+
+    def log(self, request, response, timing):
+        data = {
+            'method': request.method,
+            'path': request.path,
+            'view': timing.view_name,
+            'status': response.status_code,
+            'queries': timing.query_count,
+        }
+        data.update(
+            (f'{name}_ms', round(timing.durations[name] * 1000, 1))
+            for name in ('total',) + PHASES if name in timing.durations
+        )
+        message = ' '.join(f'{key}={value}' for key, value in data.items())
+        logger.info(message, extra={'timing': data})
+
+        if (data['total_ms'] < settings.SLOW_REQUEST_MS
+                and data['queries'] <= settings.SLOW_REQUEST_QUERIES):
+            return
+        queries = timing.get_normalized_queries()
+        slow_logger.warning(
+            '%s\n%s',
+            message,
+            '\n'.join(
+                f'  {count} x {duration * 1000:.1f} ms: {sql}'
+                for count, duration, sql in queries
+            ),
+            extra={'timing': data, 'queries': queries},
+        )
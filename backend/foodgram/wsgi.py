@@ -1,7 +1,17 @@
 import os
 
 from django.core.wsgi import get_wsgi_application
+from django.db import DatabaseError
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
 application = get_wsgi_application()
+
+# Индекс ингредиентов строится при запуске воркера,
+# если БД ещё не готова - при первом поиске.
+from recipes.search import ingredient_index  # noqa: E402
+
+try:
+    ingredient_index.build()
+except DatabaseError:
+    pass
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.admin import TabularInline, register
 
+from .images import image_processor
 from .models import Ingredient, IngredientAmount, Recipe, Tag
 
 EMPTY_VALUE_DISPLAY = 'Значение не задано'
@@ -49,12 +50,19 @@ class RecipeAdmin(admin.ModelAdmin):
     list_display = (
         'name',
         'author',
+        'favorites_count',
+        'in_carts_count',
     )
     fields = (
         ('name', 'cooking_time',),
         ('author', 'tags',),
         ('text',),
         ('image',),
+        ('favorites_count', 'in_carts_count',),
+    )
+    readonly_fields = (
+        'favorites_count',
+        'in_carts_count',
     )
     raw_id_fields = ('author',)
     search_fields = (
@@ -69,3 +77,14 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = (IngredientInline,)
     save_on_top = True
     empty_value_display = EMPTY_VALUE_DISPLAY
+
+    def save_model(self, request, obj, form, change):
+        """
+        При смене изображения заново создаёт его варианты.
+        """
+        image_changed = 'image' in form.changed_data
+        if image_changed:
+            obj.has_image_variants = False
+        super().save_model(request, obj, form, change)
+        if image_changed:
+            image_processor.submit_on_commit(obj)
@@ -0,0 +1,89 @@
+"""
+Денормализованные счётчики рецептов, подписчиков, избранного
+и списков покупок.
+Обновляются обработчиками сигналов атомарными UPDATE с F(),
+расхождения исправляет команда recount.
+Версию кэша ответов счётчики не меняют: в закэшированных ответах
+они могут отставать не дольше RESPONSE_CACHE_TIMEOUT.
+"""
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Recipe
+from .services import ShoppingCart
+
+User = get_user_model()
+
+Favorite = Recipe.is_favorite.through
+Follow = User.follow.through
+
+# Модель и поле счётчика, таблица связей и столбец в ней,
+# по которому считаются связи.
+COUNTERS = (
+    (User, 'recipes_count', Recipe, 'author_id'),
+    (User, 'followers_count', Follow, 'to_user_id'),
+    (Recipe, 'favorites_count', Favorite, 'recipe_id'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe_id'),
+)
+
+
+def change_counters(model, counter, deltas):
+    """
+    Изменяет счётчик counter объектов model на величины
+    из словаря deltas {pk: изменение}.
+    Объекты с одинаковым изменением обновляются одним запросом.
+    """
+    pks_by_delta = defaultdict(list)
+    for pk, delta in deltas.items():
+        if delta:
+            pks_by_delta[delta].append(pk)
+    for delta, pks in pks_by_delta.items():
+        model.objects.filter(pk__in=pks).update(
+            **{counter: Greatest(F(counter) + delta, 0)}
+        )
+
+
+def get_m2m_counter_deltas(field, counted, instance, action, reverse,
+                           pk_set):
+    """
+    Изменения счётчиков при m2m_changed по полю field.
+    counted - 'source', если счётчик хранится у модели с полем field,
+    или 'target' - у связанной модели.
+    Удаляемые связи выбираются до изменения таблицы, поэтому
+    учитываются только действительно существующие.
+    """
+    through = field.remote_field.through
+    source = through._meta.get_field(field.m2m_field_name()).attname
+    target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+    own, other = (target, source) if reverse else (source, target)
+    if action == 'post_add':
+        ids, sign = list(pk_set), 1
+    elif action in ('pre_remove', 'pre_clear'):
+        links = through.objects.filter(**{own: instance.pk})
+        if action == 'pre_remove':
+            links = links.filter(**{f'{other}__in': pk_set})
+        ids, sign = list(links.values_list(other, flat=True)), -1
+    else:
+        return {}
+    if (counted == 'source') != reverse:
+        return {instance.pk: sign * len(ids)}
+    return {pk: sign for pk in ids}
+
+
+def get_actual_count(link_model, column):
+    """
+    Подзапрос с фактическим количеством связей для счётчика.
+    """
+    return Coalesce(
+        Subquery(
+            link_model.objects.filter(
+                **{column: OuterRef('pk')}
+            ).order_by().values(column).annotate(
+                count=Count('pk')
+            ).values('count')
+        ),
+        0,
+    )
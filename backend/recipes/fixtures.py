@@ -0,0 +1,52 @@
+"""
+Потоковое чтение JSON-файлов для команд загрузки данных.
+"""
+import gzip
+import json
+import re
+
+READ_SIZE = 64 * 1024
+SEPARATORS = re.compile(r'[\s,]*')
+
+
+class FixtureFormatError(ValueError):
+    pass
+
+
+def open_fixture(path):
+    """
+    Открывает файл на чтение, сжатые gzip файлы распаковываются на лету.
+    """
+    if str(path).endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='UTF-8')
+    return open(path, 'r', encoding='UTF-8')
+
+
+def iter_json_array(file):
+    """
+    Читает элементы JSON-массива по частям, не загружая файл целиком.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, eof = '', 0, False
+    started = False
+    while True:
+        position = SEPARATORS.match(buffer, position).end()
+        if not started and buffer[position:position + 1] == '[':
+            started, position = True, position + 1
+            continue
+        if started and buffer[position:position + 1] == ']':
+            return
+        try:
+            if not started or position == len(buffer):
+                raise ValueError
+            item, position = decoder.raw_decode(buffer, position)
+        except ValueError:
+            if eof:
+                raise FixtureFormatError(
+                    'Некорректный JSON-файл: ожидался массив объектов.'
+                )
+            chunk = file.read(READ_SIZE)
+            eof = not chunk
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        yield item
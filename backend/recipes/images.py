@@ -0,0 +1,152 @@
+"""
+Обработка изображений рецептов: уменьшенные копии и WebP-варианты.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from threading import BoundedSemaphore, Lock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+# Вариант: (максимальный размер или None для исходного, формат)
+IMAGE_VARIANTS = {
+    'thumbnail': ((480, 480), 'JPEG'),
+    'thumbnail_webp': ((480, 480), 'WEBP'),
+    'webp': (None, 'WEBP'),
+}
+FORMAT_EXTENSIONS = {
+    'JPEG': 'jpg',
+    'WEBP': 'webp',
+}
+
+
+def get_variant_name(name, variant):
+    """
+    Имя файла варианта variant, хранящегося рядом с исходным файлом name.
+    """
+    root, _ = os.path.splitext(name)
+    _, image_format = IMAGE_VARIANTS[variant]
+    return f'{root}_{variant}.{FORMAT_EXTENSIONS[image_format]}'
+
+
+def get_variant_urls(recipe):
+    """
+    Возвращает ссылки на варианты изображения рецепта recipe
+    или None, если они ещё не созданы.
+    """
+    if not recipe.image or not recipe.has_image_variants:
+        return None
+    return {
+        variant: default_storage.url(
+            get_variant_name(recipe.image.name, variant)
+        )
+        for variant in IMAGE_VARIANTS
+    }
+
+
+def generate_variants(name, storage=default_storage):
+    """
+    Создаёт все варианты изображения name и сохраняет их рядом с ним.
+    """
+    with storage.open(name) as file:
+        image = Image.open(file)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    for variant, (size, image_format) in IMAGE_VARIANTS.items():
+        variant_image = image.copy()
+        if size:
+            variant_image.thumbnail(size)
+        if image_format == 'JPEG' and variant_image.mode != 'RGB':
+            variant_image = variant_image.convert('RGB')
+        buffer = BytesIO()
+        variant_image.save(
+            buffer, image_format, quality=settings.RECIPE_IMAGE_QUALITY
+        )
+        variant_name = get_variant_name(name, variant)
+        if storage.exists(variant_name):
+            storage.delete(variant_name)
+        storage.save(variant_name, ContentFile(buffer.getvalue()))
+
+
+def process_recipe_image(recipe_id, name):
+    """
+    Создаёт варианты изображения name и отмечает их готовность у рецепта,
+    если изображение рецепта за это время не сменилось.
+    """
+    generate_variants(name)
+    recipe = Recipe.objects.filter(pk=recipe_id, image=name).first()
+    if recipe is not None:
+        recipe.has_image_variants = True
+        recipe.save(update_fields=('has_image_variants',))
+
+
+class ImageProcessor:
+    """
+    Фоновая обработка изображений в ограниченном пуле потоков.
+    Очередь тоже ограничена: при переполнении задача отбрасывается,
+    пропущенные варианты создаёт команда generate_image_variants.
+    При max_workers=0 обработка выполняется сразу в текущем потоке.
+    """
+
+    def __init__(self, max_workers, max_pending):
+        self.max_workers = max_workers
+        self._slots = BoundedSemaphore(max(max_pending, 1))
+        self._executor = None
+        self._lock = Lock()
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix='recipe-images',
+                )
+            return self._executor
+
+    def submit_on_commit(self, recipe):
+        """
+        Ставит изображение рецепта recipe в очередь
+        после фиксации текущей транзакции.
+        """
+        if not recipe.image:
+            return
+        recipe_id, name = recipe.pk, recipe.image.name
+        transaction.on_commit(lambda: self.submit(recipe_id, name))
+
+    def submit(self, recipe_id, name):
+        if not self.max_workers:
+            process_recipe_image(recipe_id, name)
+            return True
+        if not self._slots.acquire(blocking=False):
+            logger.warning(
+                'Очередь обработки изображений заполнена, %s пропущено', name
+            )
+            return False
+        future = self.executor.submit(self._run, recipe_id, name)
+        future.add_done_callback(lambda future: self._slots.release())
+        return True
+
+    def _run(self, recipe_id, name):
+        try:
+            process_recipe_image(recipe_id, name)
+        except Exception:
+            logger.exception('Ошибка обработки изображения %s', name)
+        finally:
+            connections.close_all()
+
+
+image_processor = ImageProcessor(
+    settings.RECIPE_IMAGE_WORKERS, settings.RECIPE_IMAGE_QUEUE_SIZE
+)
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+
+    help = 'Создание уменьшенных копий и WebP-вариантов изображений рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать варианты для всех рецептов',
+        )
+
+    def handle(self, **options):
+        recipes = Recipe.objects.exclude(image='').exclude(image=None)
+        if not options['all']:
+            recipes = recipes.filter(has_image_variants=False)
+        processed = failed = 0
+        for recipe_id, name in recipes.values_list('id', 'image').iterator():
+            try:
+                process_recipe_image(recipe_id, name)
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'{name}: {error}')
+                continue
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {processed}, с ошибками: {failed}.'
+        ))
@@ -1,30 +1,186 @@
 import csv
+import io
+from itertools import islice
+from pathlib import Path
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.cache import response_cache
+from recipes.fixtures import FixtureFormatError, iter_json_array, open_fixture
 from recipes.models import Ingredient
 
+CHUNK_SIZE = 5000
+FORMATS = ('csv', 'json')
+
+
+def read_csv(file):
+    """
+    Построчно читает пары (название, единица измерения) из CSV-файла.
+    """
+    for row in csv.reader(file, delimiter=','):
+        if row == ['name', 'measurement_unit']:
+            continue
+        yield tuple(row) if len(row) == 2 else None
+
+
+def read_json(file):
+    """
+    Построчно читает пары (название, единица измерения) из JSON-массива.
+    """
+    for item in iter_json_array(file):
+        if isinstance(item, dict):
+            yield item.get('name'), item.get('measurement_unit')
+        else:
+            yield None
+
+
+READERS = {'csv': read_csv, 'json': read_json}
+
 
 class Command(BaseCommand):
 
-    help = 'Загрузка списка ингредиентов из CSV-файла'
+    help = 'Загрузка списка ингредиентов из CSV- или JSON-файла'
 
-    def handle(self, **kwargs):
-        with open(
-            settings.LOAD_INGR_PATH,
-            'r',
-            encoding='UTF-8'
-        ) as file:
-            reader = csv.reader(file, delimiter=',')
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=settings.LOAD_INGR_PATH,
+            help='Путь к файлу с ингредиентами',
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='Формат файла, по умолчанию определяется по расширению',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help='Количество строк, записываемых за один запрос',
+        )
+        parser.add_argument(
+            '--no-copy',
+            action='store_true',
+            help='Не использовать COPY даже на PostgreSQL',
+        )
 
-            ingredient_list = [
-                Ingredient(
-                    name=row[0],
-                    measurement_unit=row[1]
-                )
-                for row in reader
-            ]
-        Ingredient.objects.bulk_create(ingredient_list)
+    def handle(self, **options):
+        path = Path(options['path'])
+        name = path.name[:-3] if path.name.endswith('.gz') else path.name
+        file_format = (
+            options['format'] or Path(name).suffix.lstrip('.').lower()
+        )
+        if file_format not in FORMATS:
+            raise CommandError(
+                f'Неизвестный формат файла: {path.name}. '
+                'Укажите --format csv или --format json.'
+            )
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size должен быть больше нуля.')
+        use_copy = (
+            connection.vendor == 'postgresql' and not options['no_copy']
+        )
+        self.verbosity = options['verbosity']
+        self.read = self.invalid = self.created = 0
+        try:
+            with open_fixture(path) as file:
+                rows = self.clean_rows(READERS[file_format](file))
+                if use_copy:
+                    self.import_with_copy(rows, options['chunk_size'])
+                else:
+                    self.import_in_chunks(rows, options['chunk_size'])
+        except OSError as error:
+            raise CommandError(f'Не удалось прочитать файл: {error}')
+        except FixtureFormatError as error:
+            raise CommandError(error)
+
+        if self.created:
+            response_cache.bump(Ingredient)
         self.stdout.write(self.style.SUCCESS(
-                          'Ингредиенты успешно загружены в БД.'
-                          ))
+            f'Ингредиенты загружены в БД. Прочитано строк: {self.read}, '
+            f'добавлено: {self.created}, '
+            f'уже были в БД: {self.read - self.invalid - self.created}, '
+            f'пропущено некорректных: {self.invalid}.'
+        ))
+
+    def clean_rows(self, rows):
+        """
+        Отбрасывает некорректные строки и обрезает пробелы.
+        """
+        max_name = Ingredient._meta.get_field('name').max_length
+        max_unit = Ingredient._meta.get_field('measurement_unit').max_length
+        for row in rows:
+            self.read += 1
+            if row is None or not all(isinstance(value, str) for value in row):
+                self.invalid += 1
+                continue
+            name, unit = (value.strip() for value in row)
+            if not name or not unit or (
+                len(name) > max_name or len(unit) > max_unit
+            ):
+                self.invalid += 1
+                continue
+            yield name, unit
+
+    def chunks(self, rows, chunk_size):
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+            self.report_progress()
+
+    def report_progress(self):
+        if self.verbosity > 1:
+            self.stdout.write(f'Обработано строк: {self.read}')
+
+    def import_in_chunks(self, rows, chunk_size):
+        """
+        Записывает отсутствующие в БД ингредиенты порциями через ORM.
+        """
+        for chunk in self.chunks(rows, chunk_size):
+            chunk = set(chunk)
+            existing = set(
+                Ingredient.objects.filter(
+                    name__in={name for name, _ in chunk}
+                ).values_list('name', 'measurement_unit')
+            )
+            new = chunk - existing
+            with transaction.atomic():
+                Ingredient.objects.bulk_create(
+                    (
+                        Ingredient(name=name, measurement_unit=unit)
+                        for name, unit in new
+                    ),
+                    ignore_conflicts=True,
+                )
+            self.created += len(new)
+
+    def import_with_copy(self, rows, chunk_size):
+        """
+        Загружает строки через COPY во временную таблицу и переносит
+        новые ингредиенты одним INSERT ... ON CONFLICT DO NOTHING.
+        """
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_import '
+                '(name text, measurement_unit text) ON COMMIT DROP'
+            )
+            for chunk in self.chunks(rows, chunk_size):
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(chunk)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    'COPY ingredient_import FROM STDIN WITH (FORMAT csv)',
+                    buffer,
+                )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT name, measurement_unit '
+                'FROM ingredient_import '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
+            self.created = cursor.rowcount
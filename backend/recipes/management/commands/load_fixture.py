@@ -0,0 +1,247 @@
+from collections import Counter, defaultdict
+from time import monotonic
+
+from django.apps import apps
+from django.core import serializers
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.core.serializers.base import DeserializationError
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+
+from api.cache import response_cache
+from recipes.counters import COUNTERS
+from recipes.fixtures import FixtureFormatError, iter_json_array, open_fixture
+from recipes.models import IngredientAmount, Recipe, ShoppingCartIngredient
+
+BATCH_SIZE = 2000
+
+
+def get_dependencies(model):
+    """
+    Модели, на которые ссылаются внешние ключи модели model.
+    """
+    return {
+        field.related_model for field in model._meta.concrete_fields
+        if field.is_relation and field.related_model is not model
+    }
+
+
+def sort_models(models):
+    """
+    Упорядочивает модели так, чтобы модели, на которые ссылаются
+    внешние ключи, шли раньше ссылающихся на них.
+    """
+    pending, ordered = list(models), []
+    while pending:
+        for model in pending:
+            if not get_dependencies(model) & set(pending):
+                break
+        else:
+            model = pending[0]
+        pending.remove(model)
+        ordered.append(model)
+    return ordered
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Быстрая загрузка фикстур в формате JSON (как у dumpdata) '
+        'пакетными INSERT без сигналов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'fixtures',
+            nargs='+',
+            help='Пути к файлам фикстур (.json или .json.gz)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Количество объектов в одном INSERT',
+        )
+        parser.add_argument(
+            '-e', '--exclude',
+            action='append',
+            default=[],
+            help='Не загружать приложение или модель (app_label.ModelName)',
+        )
+        parser.add_argument(
+            '-i', '--ignorenonexistent',
+            action='store_true',
+            help='Пропускать поля и модели, которых больше нет',
+        )
+        parser.add_argument(
+            '--ignore-conflicts',
+            action='store_true',
+            help='Пропускать объекты, уже существующие в БД',
+        )
+        parser.add_argument(
+            '--database',
+            default=DEFAULT_DB_ALIAS,
+            help='Псевдоним базы данных',
+        )
+
+    def handle(self, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        self.using = options['database']
+        self.batch_size = options['batch_size']
+        self.ignore_conflicts = options['ignore_conflicts']
+        self.verbosity = options['verbosity']
+        self.excluded = self.get_excluded(options['exclude'])
+        self.buffers = defaultdict(list)
+        self.counts = Counter()
+        connection = connections[self.using]
+        started = monotonic()
+
+        try:
+            with transaction.atomic(using=self.using):
+                with connection.constraint_checks_disabled():
+                    for path in options['fixtures']:
+                        self.load_file(path, options['ignorenonexistent'])
+                    for model in sort_models(list(self.buffers)):
+                        self.flush(model)
+                loaded = list(self.counts)
+                connection.check_constraints(
+                    table_names=[model._meta.db_table for model in loaded]
+                )
+                self.reset_sequences(connection, loaded)
+        except (DatabaseError, DeserializationError) as error:
+            raise CommandError(f'Ошибка загрузки фикстуры: {error}')
+        self.after_load(loaded)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено объектов: {sum(self.counts.values())} '
+            f'(моделей: {len(self.counts)}) '
+            f'за {monotonic() - started:.1f} с.'
+        ))
+        if self.verbosity > 1:
+            for model, count in self.counts.most_common():
+                self.stdout.write(f'  {model._meta.label}: {count}')
+
+    def get_excluded(self, labels):
+        excluded = set()
+        for label in labels:
+            try:
+                if '.' in label:
+                    excluded.add(apps.get_model(label))
+                else:
+                    excluded.update(
+                        apps.get_app_config(label).get_models()
+                    )
+            except LookupError:
+                raise CommandError(f'Неизвестная модель или приложение: '
+                                   f'{label}')
+        return excluded
+
+    def load_file(self, path, ignorenonexistent):
+        """
+        Читает файл по одному объекту и раскладывает их по буферам моделей.
+        """
+        try:
+            with open_fixture(path) as file:
+                objects = serializers.deserialize(
+                    'python',
+                    iter_json_array(file),
+                    using=self.using,
+                    ignorenonexistent=ignorenonexistent,
+                )
+                for deserialized in objects:
+                    self.add(deserialized)
+        except OSError as error:
+            raise CommandError(f'Не удалось прочитать файл: {error}')
+        except FixtureFormatError as error:
+            raise CommandError(f'{path}: {error}')
+
+    def add(self, deserialized):
+        obj = deserialized.object
+        model = type(obj)
+        if model in self.excluded:
+            return
+        if obj.pk is None:
+            raise CommandError(
+                f'Объект {model._meta.label} без первичного ключа: '
+                'такие фикстуры загружайте командой loaddata.'
+            )
+        self.buffer(model, obj)
+        for field_name, values in deserialized.m2m_data.items():
+            field = model._meta.get_field(field_name)
+            through = field.remote_field.through
+            if not through._meta.auto_created:
+                continue
+            source = through._meta.get_field(field.m2m_field_name()).attname
+            target = through._meta.get_field(
+                field.m2m_reverse_field_name()
+            ).attname
+            for value in values:
+                self.buffer(through, through(**{
+                    source: obj.pk, target: value,
+                }))
+
+    def buffer(self, model, obj):
+        self.buffers[model].append(obj)
+        if len(self.buffers[model]) >= self.batch_size:
+            self.flush(model)
+
+    def flush(self, model):
+        """
+        Записывает накопленные объекты модели одним INSERT.
+        Вставка идёт в режиме raw, как у loaddata: значения auto_now_add
+        и прочих полей с pre_save берутся из фикстуры.
+        """
+        objs = self.buffers.pop(model, [])
+        if not objs:
+            return
+        fields = [
+            field for field in model._meta.local_concrete_fields
+            if not (field.primary_key and objs[0].pk is None)
+        ]
+        ops = connections[self.using].ops
+        batch_size = max(min(self.batch_size,
+                             ops.bulk_batch_size(fields, objs)), 1)
+        for start in range(0, len(objs), batch_size):
+            model._base_manager._insert(
+                objs[start:start + batch_size],
+                fields=fields,
+                using=self.using,
+                raw=True,
+                ignore_conflicts=self.ignore_conflicts,
+            )
+        self.counts[model] += len(objs)
+        if self.verbosity > 1:
+            self.stdout.write(
+                f'{model._meta.label}: {self.counts[model]}'
+            )
+
+    def reset_sequences(self, connection, models):
+        sql = connection.ops.sequence_reset_sql(no_style(), models)
+        if sql:
+            with connection.cursor() as cursor:
+                for statement in sql:
+                    cursor.execute(statement)
+
+    def after_load(self, models):
+        """
+        INSERT обходит сигналы, поэтому пересчитывает то, что они
+        поддерживают: суммы в списках покупок, счётчики
+        и версии кэша ответов.
+        """
+        for model in models:
+            response_cache.bump(model)
+        cart_models = {Recipe, IngredientAmount,
+                       Recipe.is_in_shopping_list.through}
+        if cart_models & set(models) and (
+            ShoppingCartIngredient not in models
+        ):
+            call_command('rebuild_cart_totals', stdout=self.stdout,
+                         verbosity=self.verbosity)
+        counted_models = {
+            model for counter in COUNTERS for model in counter[::2]
+        }
+        if counted_models & set(models):
+            call_command('recount', stdout=self.stdout,
+                         verbosity=self.verbosity)
@@ -0,0 +1,85 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes.models import ShoppingCartIngredient
+from recipes.services import calculate_cart_totals
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+
+    help = 'Пересчёт сумм ингредиентов в списках покупок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сравнить сохранённые суммы с расчётными',
+        )
+
+    def get_expected(self):
+        return {
+            (row['user_id'], row['ingredient_id']): row['total']
+            for row in calculate_cart_totals().iterator()
+        }
+
+    def handle(self, **options):
+        if options['verify']:
+            expected = self.get_expected()
+            stored = {
+                (user_id, ingredient_id): amount
+                for user_id, ingredient_id, amount
+                in ShoppingCartIngredient.objects.values_list(
+                    'user_id', 'ingredient_id', 'amount'
+                ).iterator()
+            }
+            mismatches = [
+                key for key in expected.keys() | stored.keys()
+                if expected.get(key) != stored.get(key)
+            ]
+            if mismatches:
+                raise CommandError(
+                    f'Найдено расхождений: {len(mismatches)}. '
+                    'Запустите команду без --verify для пересчёта.'
+                )
+            self.stdout.write(self.style.SUCCESS(
+                f'Суммы в списках покупок верны ({len(stored)} строк).'
+            ))
+            return
+
+        with transaction.atomic():
+            # Суммы считаются в той же транзакции, что и перезапись.
+            # На PostgreSQL таблица блокируется от изменений, чтобы
+            # одновременные изменения списков покупок дождались пересчёта
+            # и применились к новым суммам, а не потерялись.
+            if connection.vendor == 'postgresql':
+                table = connection.ops.quote_name(
+                    ShoppingCartIngredient._meta.db_table
+                )
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LOCK TABLE {table} IN EXCLUSIVE MODE')
+            expected = self.get_expected()
+            # Явный batch_size в bulk_create не ограничивается
+            # возможностями БД (SQLite - не больше 999 параметров).
+            fields = [
+                ShoppingCartIngredient._meta.get_field(name)
+                for name in ('user', 'ingredient', 'amount')
+            ]
+            batch_size = min(
+                BATCH_SIZE, connection.ops.bulk_batch_size(fields, expected)
+            )
+            ShoppingCartIngredient.objects.all().delete()
+            ShoppingCartIngredient.objects.bulk_create(
+                (
+                    ShoppingCartIngredient(
+                        user_id=user_id, ingredient_id=ingredient_id,
+                        amount=amount,
+                    )
+                    for (user_id, ingredient_id), amount in expected.items()
+                ),
+                batch_size=batch_size,
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Суммы в списках покупок пересчитаны ({len(expected)} строк).'
+        ))
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+
+from recipes.counters import COUNTERS, get_actual_count
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Пересчёт счётчиков рецептов, подписчиков, избранного '
+        'и списков покупок'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сравнить сохранённые счётчики с расчётными',
+        )
+
+    def handle(self, **options):
+        total = 0
+        with transaction.atomic():
+            for model, counter, link_model, column in COUNTERS:
+                actual = get_actual_count(link_model, column)
+                drifted = model.objects.annotate(
+                    actual_count=actual
+                ).exclude(**{counter: F('actual_count')})
+                count = drifted.count()
+                total += count
+                if options['verbosity'] > 1 or count:
+                    self.stdout.write(
+                        f'{model._meta.label}.{counter}: '
+                        f'расхождений {count}'
+                    )
+                if count and not options['verify']:
+                    model.objects.filter(
+                        pk__in=drifted.values('pk')
+                    ).update(**{counter: actual})
+
+        if options['verify']:
+            if total:
+                raise CommandError(
+                    f'Найдено расхождений: {total}. '
+                    'Запустите команду без --verify для пересчёта.'
+                )
+            self.stdout.write(self.style.SUCCESS('Счётчики верны.'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики пересчитаны, исправлено строк: {total}.'
+        ))
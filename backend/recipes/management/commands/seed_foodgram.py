@@ -0,0 +1,109 @@
+import multiprocessing
+from collections import Counter
+from time import monotonic
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, connections
+
+from recipes.models import Ingredient
+from recipes.seeding import (CHUNK_SIZE, RECIPES_PER_SCALE, USERS_PER_SCALE,
+                             Dataset, create_chunk, init_worker)
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Заполнение БД синтетическими пользователями, подписками, '
+        'рецептами, избранным и списками покупок для нагрузочного '
+        'тестирования'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale',
+            type=float,
+            default=1,
+            help=f'Масштаб: {USERS_PER_SCALE} пользователей '
+                 f'и {RECIPES_PER_SCALE} рецептов на единицу',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Начальное значение генератора данных',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Количество процессов (больше 1 - только для PostgreSQL)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help='Количество пользователей или рецептов в одной части',
+        )
+
+    def handle(self, **options):
+        if options['scale'] <= 0:
+            raise CommandError('--scale должен быть больше нуля.')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size должен быть больше нуля.')
+        if options['workers'] < 1:
+            raise CommandError('--workers должен быть больше нуля.')
+        if options['workers'] > 1 and connection.vendor != 'postgresql':
+            raise CommandError(
+                'Параллельная запись поддерживается только PostgreSQL, '
+                'запустите команду без --workers.'
+            )
+        self.verbosity = options['verbosity']
+        if not Ingredient.objects.exists():
+            self.stdout.write(self.style.WARNING(
+                'Каталог ингредиентов пуст, будут созданы синтетические '
+                'ингредиенты. Для реалистичных данных сначала выполните '
+                'import_ingredients.'
+            ))
+
+        dataset = Dataset(
+            options['scale'], options['seed'], options['chunk_size']
+        )
+        started = monotonic()
+        try:
+            if options['workers'] == 1:
+                counts = dataset.create(
+                    stdout=self.stdout, verbosity=self.verbosity
+                )
+            else:
+                counts = self.create_parallel(dataset, options['workers'])
+        except DatabaseError as error:
+            raise CommandError(f'Ошибка записи в БД: {error}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано объектов: {sum(counts.values())} '
+            f'за {monotonic() - started:.1f} с.'
+        ))
+        if self.verbosity > 1:
+            for label, count in counts.most_common():
+                self.stdout.write(f'  {label}: {count}')
+
+    def create_parallel(self, dataset, workers):
+        """
+        Создаёт части каждого этапа в пуле процессов.
+        Части записываются в отдельных транзакциях, поэтому при ошибке
+        уже созданные части остаются в БД.
+        """
+        dataset.prepare()
+        counts = Counter()
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with context.Pool(workers, init_worker, (dataset,)) as pool:
+            for phase, chunks in dataset.get_phases():
+                for result in pool.imap_unordered(
+                        create_chunk,
+                        [(phase, start, stop) for start, stop in chunks]):
+                    counts.update(result)
+                if self.verbosity > 1:
+                    self.stdout.write(f'Этап {phase} завершён.')
+        dataset.finish(stdout=self.stdout, verbosity=self.verbosity)
+        return counts
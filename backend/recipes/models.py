@@ -3,7 +3,7 @@ from django.core.validators import (MaxValueValidator, MinValueValidator,
                                     MaxLengthValidator, MinLengthValidator)
 from django.db import models
 
-from users.models import User
+from users.models import CounterFieldsMixin, User
 
 
 class Tag(models.Model):
@@ -57,7 +57,7 @@ class Ingredient(models.Model):
         return f'{self.name}, {self.measurement_unit}.'
 
 
-class Recipe(models.Model):
+class Recipe(CounterFieldsMixin, models.Model):
     """
     Модель рецепта
     """
@@ -78,6 +78,11 @@ class Recipe(models.Model):
         null=True,
         verbose_name='Изображение блюда',
     )
+    has_image_variants = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Уменьшенные копии изображения созданы',
+    )
     text = models.TextField(
         validators=(
             MinLengthValidator(
@@ -131,9 +136,31 @@ class Recipe(models.Model):
         related_name='shopping_list',
         verbose_name='Список покупок',
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном',
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок',
+    )
+
+    counter_fields = ('favorites_count', 'in_carts_count')
 
     class Meta:
         ordering = ['-create_data', ]
+        indexes = (
+            models.Index(
+                fields=('create_data', 'id', ),
+                name='recipe_create_data_id',
+            ),
+            models.Index(
+                fields=('author', 'create_data', 'id', ),
+                name='recipe_author_create_data',
+            ),
+        )
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -181,3 +208,40 @@ class IngredientAmount(models.Model):
 
     def __str__(self):
         return f'{self.amount} {self.ingredients}'
+
+
+class ShoppingCartIngredient(models.Model):
+    """
+    Суммарное количество ингредиента в списке покупок пользователя.
+    Поддерживается обработчиками сигналов при изменении списка покупок
+    и ингредиентов рецептов, пересчитывается командой rebuild_cart_totals.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_ingredients',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_carts',
+        verbose_name='Ингредиент',
+    )
+    amount = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество',
+    )
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списках покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient', ),
+                name='shopping_cart_ingredient'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.user}: {self.amount} {self.ingredient}'
@@ -0,0 +1,163 @@
+"""
+Поиск ингредиентов для автодополнения.
+"""
+from bisect import bisect_left
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from api.cache import response_cache
+
+from .models import Ingredient
+
+
+class IngredientSearchIndex:
+    """
+    Поисковый индекс ингредиентов в памяти процесса.
+    Совпадения в начале названия ищутся бинарным поиском
+    по отсортированному списку названий, совпадения в середине -
+    по индексу n-грамм. Порядок выдачи совпадает с прежним запросом к БД:
+    сначала совпадения в начале названия, затем в середине,
+    внутри каждой группы - по алфавиту.
+    При shared = True индекс перестраивается, когда меняется версия
+    ингредиентов в общем кэше (её увеличивают сигналы, import_ingredients
+    и load_fixture), иначе - раз в ttl секунд и при изменении
+    ингредиентов в этом же процессе.
+    """
+    ngram_size = 3
+
+    def __init__(self, ttl=None, shared=False):
+        self.ttl = ttl
+        self.shared = shared
+        self._lock = Lock()
+        self._data = None
+        self._version = None
+        self._built_at = 0
+
+    def invalidate(self):
+        """
+        Сбрасывает индекс, он будет перестроен при следующем поиске.
+        """
+        self._data = None
+
+    def build(self):
+        """
+        Загружает ингредиенты из БД и строит индекс.
+        """
+        with self._lock:
+            return self._build()
+
+    def _build(self):
+        if self.shared:
+            self._version = self._get_version()
+        ingredients = sorted(
+            Ingredient.objects.all(),
+            key=lambda ingredient: (ingredient.name, ingredient.id),
+        )
+        names = [ingredient.name for ingredient in ingredients]
+        ngrams = {}
+        for position, name in enumerate(names):
+            for gram in self._get_ngrams(name):
+                ngrams.setdefault(gram, []).append(position)
+        self._data = names, ingredients, ngrams
+        self._built_at = monotonic()
+        return self._data
+
+    def search(self, name, limit=None):
+        """
+        Возвращает ингредиенты, в названии которых встречается name.
+        limit ограничивает количество результатов.
+        """
+        names, ingredients, ngrams = self._get_data()
+        start = bisect_left(names, name)
+        end = bisect_left(names, name + chr(0x10FFFF), start)
+        result = ingredients[start:end]
+        if limit and len(result) >= limit:
+            return result[:limit]
+
+        grams = self._get_ngrams(name, min(len(name), self.ngram_size))
+        candidates = min(
+            (ngrams.get(gram, ()) for gram in grams), key=len, default=()
+        )
+        for position in candidates:
+            if start <= position < end or name not in names[position]:
+                continue
+            result.append(ingredients[position])
+            if limit and len(result) >= limit:
+                break
+        return result
+
+    def _get_data(self):
+        with self._lock:
+            if self.shared:
+                if self._data is None or self._get_version() != self._version:
+                    self._build()
+            elif self._data is None or (
+                self.ttl and monotonic() - self._built_at > self.ttl
+            ):
+                self._build()
+            return self._data
+
+    def _get_version(self):
+        return response_cache.get_versions((Ingredient,))
+
+    def _get_ngrams(self, name, size=None):
+        sizes = (size,) if size else range(1, self.ngram_size + 1)
+        return {
+            name[i:i + size]
+            for size in sizes
+            for i in range(len(name) - size + 1)
+        }
+
+
+class DatabaseIngredientSearch:
+    """
+    Поиск ингредиентов запросом к БД.
+    На PostgreSQL использует GIN-индекс pg_trgm (создаётся после миграций):
+    кроме совпадений по подстроке находит похожие по триграммам названия,
+    что допускает опечатки, и упорядочивает их по степени сходства.
+    На других СУБД ищет только по подстроке.
+    """
+
+    def search(self, name, limit=None):
+        """
+        Возвращает ингредиенты, подходящие под запрос name:
+        сначала совпадения в начале названия, затем в середине,
+        затем похожие названия.
+        limit ограничивает количество результатов.
+        """
+        rank = Case(
+            When(name__startswith=name, then=Value(0)),
+            When(name__contains=name, then=Value(1)),
+            default=Value(2),
+            output_field=IntegerField(),
+        )
+        if connection.vendor == 'postgresql':
+            queryset = Ingredient.objects.filter(
+                Q(name__contains=name) | Q(name__trigram_similar=name)
+            ).annotate(
+                rank=rank, similarity=TrigramSimilarity('name', name)
+            ).order_by('rank', '-similarity', 'name')
+        else:
+            queryset = Ingredient.objects.filter(
+                name__contains=name
+            ).annotate(rank=rank).order_by('rank', 'name')
+        if limit:
+            queryset = queryset[:limit]
+        return queryset
+
+
+ingredient_index = IngredientSearchIndex(
+    ttl=settings.INGREDIENT_INDEX_TTL, shared=settings.CACHE_IS_SHARED
+)
+
+SEARCH_BACKENDS = {
+    'memory': ingredient_index,
+    'database': DatabaseIngredientSearch(),
+}
+
+ingredient_search = SEARCH_BACKENDS[settings.INGREDIENT_SEARCH_BACKEND]
@@ -0,0 +1,371 @@
+"""
+Генерация синтетических данных для бенчмарков и нагрузочного
+тестирования.
+Набор данных детерминирован: одинаковые масштаб и seed дают одинаковые
+объекты. Объекты создаются частями, у каждой части свой генератор
+случайных чисел, поэтому результат не зависит от порядка их обработки.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import accumulate
+from random import Random
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from api.cache import response_cache
+from users.models import User
+
+from .models import Ingredient, IngredientAmount, Recipe, Tag
+from .services import ShoppingCart
+
+Favorite = Recipe.is_favorite.through
+Follow = User.follow.through
+RecipeTag = Recipe.tags.through
+
+# Количество объектов на единицу масштаба.
+USERS_PER_SCALE = 100
+RECIPES_PER_SCALE = 500
+INGREDIENTS_PER_SCALE = 200
+
+# Среднее количество связей на пользователя и рецепт.
+FOLLOWS_PER_USER = 10
+FAVORITES_PER_USER = 20
+CART_RECIPES_PER_USER = 5
+TAGS_PER_RECIPE = (1, 3)
+INGREDIENTS_PER_RECIPE = (3, 10)
+
+# Показатель степенного распределения популярности авторов и рецептов.
+POPULARITY_EXPONENT = 1.1
+CHUNK_SIZE = 1000
+PASSWORD = 'seed-password'
+LATEST_DATE = datetime(2022, 1, 1, tzinfo=timezone.utc)
+DATES_SPAN = timedelta(days=365)
+
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+    ('Десерт', '#F2C94C', 'dessert'),
+    ('Выпечка', '#B5651D', 'bakery'),
+    ('Салат', '#6FCF97', 'salad'),
+    ('Суп', '#EB5757', 'soup'),
+    ('Напиток', '#2D9CDB', 'drink'),
+)
+INGREDIENT_WORDS = (
+    'мука', 'сахар', 'соль', 'молоко', 'масло', 'яйцо', 'рис', 'гречка',
+    'картофель', 'морковь', 'лук', 'чеснок', 'томат', 'огурец', 'сыр',
+    'творог', 'курица', 'говядина', 'свинина', 'рыба', 'перец', 'укроп',
+    'петрушка', 'яблоко', 'груша', 'лимон', 'мёд', 'орех', 'изюм', 'какао',
+)
+INGREDIENT_KINDS = (
+    'обычный', 'молотый', 'свежий', 'сушёный', 'домашний', 'мелкий',
+    'крупный', 'отборный',
+)
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+RECIPE_WORDS = (
+    'Пирог', 'Салат', 'Суп', 'Рагу', 'Запеканка', 'Каша', 'Оладьи',
+    'Котлеты', 'Паста', 'Омлет', 'Плов', 'Морс', 'Кекс', 'Блины',
+)
+
+
+def reset_sequences(models):
+    """
+    Сдвигает последовательности первичных ключей после вставки
+    объектов с явно заданными id.
+    """
+    sql = connection.ops.sequence_reset_sql(no_style(), models)
+    if sql:
+        with connection.cursor() as cursor:
+            for statement in sql:
+                cursor.execute(statement)
+
+
+def insert_objects(model, objs, batch_size=CHUNK_SIZE):
+    """
+    Вставляет объекты пакетами без вызова pre_save, поэтому сохраняются
+    заданные значения полей с auto_now_add. Первичный ключ передаётся,
+    только если он задан.
+    """
+    fields = [
+        field for field in model._meta.concrete_fields
+        if objs and (not field.primary_key or objs[0].pk is not None)
+    ]
+    if not fields:
+        return 0
+    batch_size = min(
+        batch_size, connection.ops.bulk_batch_size(fields, objs) or 1
+    )
+    for start in range(0, len(objs), batch_size):
+        model._base_manager._insert(
+            objs[start:start + batch_size], fields=fields, raw=True,
+        )
+    return len(objs)
+
+
+def get_popularity(size, exponent=POPULARITY_EXPONENT):
+    """
+    Накопленные веса степенного распределения для size объектов:
+    объект с номером i выбирается с вероятностью ~ 1 / (i + 1) ** exponent.
+    """
+    return list(accumulate(1 / (rank + 1) ** exponent
+                           for rank in range(size)))
+
+
+def get_links_count(rng, mean, population):
+    """
+    Количество связей объекта с распределением Парето и средним mean,
+    не больше половины population.
+    """
+    return min(population // 2, int(rng.paretovariate(1.5) * mean / 3))
+
+
+class Dataset:
+    """
+    Набор синтетических данных масштаба scale.
+    prepare() создаёт тэги и ингредиенты (существующие в БД тэги
+    и ингредиенты каталога используются повторно) и определяет
+    диапазоны id; объекты создаются методами create_* для частей
+    [start, stop) в порядке users, recipes, relations.
+    """
+
+    def __init__(self, scale=1, seed=0, chunk_size=CHUNK_SIZE):
+        self.scale = scale
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.users_count = max(2, int(USERS_PER_SCALE * scale))
+        self.recipes_count = max(1, int(RECIPES_PER_SCALE * scale))
+        self.ingredients_count = max(
+            INGREDIENTS_PER_RECIPE[1], int(INGREDIENTS_PER_SCALE * scale)
+        )
+
+    def prepare(self):
+        self.tags_ids = self.get_tags_ids()
+        self.ingredients_ids = self.get_ingredients_ids()
+        self.first_user_id = self.get_next_id(User)
+        self.first_recipe_id = self.get_next_id(Recipe)
+        self.password = make_password(PASSWORD)
+        self.authors_popularity = get_popularity(self.users_count)
+        self.recipes_popularity = get_popularity(self.recipes_count)
+
+    def get_chunks(self, count):
+        return [
+            (start, min(start + self.chunk_size, count))
+            for start in range(0, count, self.chunk_size)
+        ]
+
+    def get_random(self, kind, start):
+        return Random(f'{self.seed}:{kind}:{start}')
+
+    def get_next_id(self, model):
+        last_id = model._base_manager.aggregate(
+            last_id=Max('pk')
+        )['last_id']
+        return (last_id or 0) + 1
+
+    def get_tags_ids(self):
+        tags = Tag.objects.all()
+        if not tags.exists():
+            insert_objects(Tag, [
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in TAGS
+            ])
+        return list(tags.order_by('id').values_list('id', flat=True))
+
+    def get_ingredients_ids(self):
+        ingredients = Ingredient.objects.all()
+        if not ingredients.exists():
+            rng = self.get_random('ingredients', 0)
+            names = sorted({
+                (f'{rng.choice(INGREDIENT_WORDS)} '
+                 f'{rng.choice(INGREDIENT_KINDS)} {number}')
+                for number in range(self.ingredients_count)
+            })
+            insert_objects(Ingredient, [
+                Ingredient(name=name, measurement_unit=rng.choice(UNITS))
+                for name in names
+            ])
+        return list(ingredients.order_by('id').values_list('id', flat=True))
+
+    def create_users(self, start, stop):
+        users = []
+        for number in range(start, stop):
+            pk = self.first_user_id + number
+            users.append(User(
+                id=pk,
+                username=f'seed{pk}',
+                email=f'seed{pk}@example.com',
+                first_name=f'Имя{number}',
+                last_name=f'Фамилия{number}',
+                password=self.password,
+                date_joined=LATEST_DATE,
+            ))
+        return {User: insert_objects(User, users)}
+
+    def create_recipes(self, start, stop):
+        rng = self.get_random('recipes', start)
+        recipes, tags, amounts = [], [], []
+        for number in range(start, stop):
+            pk = self.first_recipe_id + number
+            author = rng.choices(
+                range(self.users_count), cum_weights=self.authors_popularity
+            )[0]
+            recipes.append(Recipe(
+                id=pk,
+                author_id=self.first_user_id + author,
+                name=f'{rng.choice(RECIPE_WORDS)} №{pk}',
+                image=f'recipe_pictures/seed{pk % 10}.jpg',
+                text=f'Синтетический рецепт {pk} для нагрузочных тестов.',
+                cooking_time=rng.randint(5, 180),
+                create_data=LATEST_DATE - DATES_SPAN * rng.random(),
+            ))
+            tags.extend(
+                RecipeTag(recipe_id=pk, tag_id=tag_id)
+                for tag_id in rng.sample(
+                    self.tags_ids,
+                    min(len(self.tags_ids), rng.randint(*TAGS_PER_RECIPE)),
+                )
+            )
+            amounts.extend(
+                IngredientAmount(
+                    recipe_id=pk, ingredients_id=ingredient_id,
+                    amount=rng.randint(1, 500),
+                )
+                for ingredient_id in rng.sample(
+                    self.ingredients_ids,
+                    min(len(self.ingredients_ids),
+                        rng.randint(*INGREDIENTS_PER_RECIPE)),
+                )
+            )
+        return {
+            Recipe: insert_objects(Recipe, recipes),
+            RecipeTag: insert_objects(RecipeTag, tags),
+            IngredientAmount: insert_objects(
+                IngredientAmount, amounts
+            ),
+        }
+
+    def create_relations(self, start, stop):
+        """
+        Подписки, избранное и списки покупок пользователей [start, stop).
+        Популярные авторы и рецепты выбираются чаще остальных.
+        """
+        rng = self.get_random('relations', start)
+        links = {Follow: [], Favorite: [], ShoppingCart: []}
+        for number in range(start, stop):
+            user_id = self.first_user_id + number
+            authors = self.choose(
+                rng, self.authors_popularity, FOLLOWS_PER_USER,
+                exclude=number,
+            )
+            links[Follow].extend(
+                Follow(from_user_id=user_id,
+                       to_user_id=self.first_user_id + author)
+                for author in authors
+            )
+            for model, mean in ((Favorite, FAVORITES_PER_USER),
+                                (ShoppingCart, CART_RECIPES_PER_USER)):
+                recipes = self.choose(
+                    rng, self.recipes_popularity, mean
+                )
+                links[model].extend(
+                    model(user_id=user_id,
+                          recipe_id=self.first_recipe_id + recipe)
+                    for recipe in recipes
+                )
+        return {
+            model: insert_objects(model, objs)
+            for model, objs in links.items()
+        }
+
+    @staticmethod
+    def choose(rng, popularity, mean, exclude=None):
+        """
+        Выбирает без повторов номера объектов по весам popularity.
+        """
+        count = get_links_count(rng, mean, len(popularity))
+        chosen = set()
+        while len(chosen) < count:
+            chosen.update(
+                rng.choices(
+                    range(len(popularity)), cum_weights=popularity,
+                    k=count - len(chosen),
+                )
+            )
+            chosen.discard(exclude)
+        return sorted(chosen)
+
+    def get_phases(self):
+        """
+        Этапы создания объектов: [(этап, [(start, stop), ...]), ...].
+        Части одного этапа независимы, этап начинается после
+        завершения предыдущего.
+        """
+        return [
+            ('users', self.get_chunks(self.users_count)),
+            ('recipes', self.get_chunks(self.recipes_count)),
+            ('relations', self.get_chunks(self.users_count)),
+        ]
+
+    def create_chunk(self, phase, start, stop):
+        """
+        Создаёт объекты части этапа phase и возвращает их количество
+        по меткам моделей: автоматические модели связей ManyToMany
+        не передаются между процессами.
+        """
+        counts = getattr(self, f'create_{phase}')(start, stop)
+        return {model._meta.label: count for model, count in counts.items()}
+
+    def create(self, stdout=None, verbosity=1):
+        """
+        Создаёт весь набор данных в одной транзакции.
+        Возвращает количество созданных объектов по меткам моделей.
+        """
+        counts = Counter()
+        with transaction.atomic():
+            self.prepare()
+            for phase, chunks in self.get_phases():
+                for start, stop in chunks:
+                    counts.update(self.create_chunk(phase, start, stop))
+            self.finish(stdout, verbosity)
+        return counts
+
+    def finish(self, stdout=None, verbosity=1):
+        """
+        Вставка обходит сигналы, поэтому после неё пересчитываются
+        счётчики и суммы в списках покупок и сбрасывается кэш ответов.
+        """
+        models = (User, Recipe, Tag, Ingredient)
+        reset_sequences(models)
+        for model in models:
+            response_cache.bump(model)
+        call_command('recount', stdout=stdout, verbosity=verbosity)
+        call_command('rebuild_cart_totals', stdout=stdout,
+                     verbosity=verbosity)
+
+
+# Набор данных процесса пула, см. init_worker.
+worker_dataset = None
+
+
+def init_worker(dataset):
+    """
+    Инициализирует процесс пула: соединения с БД, унаследованные
+    от родительского процесса, закрываются, каждый процесс открывает своё.
+    """
+    global worker_dataset
+    connections.close_all()
+    worker_dataset = dataset
+
+
+def create_chunk(args):
+    """
+    Создаёт в процессе пула объекты одной части в отдельной транзакции.
+    """
+    phase, start, stop = args
+    with transaction.atomic():
+        return worker_dataset.create_chunk(phase, start, stop)
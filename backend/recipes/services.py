@@ -0,0 +1,142 @@
+"""
+Поддержка сумм ингредиентов в списках покупок пользователей.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models import (Case, F, IntegerField, OuterRef, Subquery, Sum,
+                              Value, When)
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import IngredientAmount, Recipe, ShoppingCartIngredient
+
+ShoppingCart = Recipe.is_in_shopping_list.through
+
+# Внутри блока deletion_applied() обработчики удаления рецептов
+# и IngredientAmount не меняют списки покупок и счётчики рецептов.
+_deletion_applied = ContextVar('deletion_applied', default=False)
+
+
+@contextmanager
+def deletion_applied():
+    """
+    Блок, в котором вызывающий код сам переносит удаление рецептов
+    и их ингредиентов в списки покупок и счётчики рецептов авторов,
+    и обработчики сигналов не выполняют запросы для каждой строки.
+    """
+    token = _deletion_applied.set(True)
+    try:
+        yield
+    finally:
+        _deletion_applied.reset(token)
+
+
+def is_deletion_applied():
+    """
+    Выполняется ли код внутри блока deletion_applied().
+    """
+    return _deletion_applied.get()
+
+
+def apply_cart_deltas(users_ids, deltas):
+    """
+    Изменяет суммы ингредиентов в списках покупок пользователей users_ids.
+    deltas - словарь {id ингредиента: изменение количества}.
+    Недостающие строки создаются, обнулившиеся удаляются.
+    """
+    deltas = {
+        ingredient_id: delta
+        for ingredient_id, delta in deltas.items() if delta
+    }
+    if not users_ids or not deltas:
+        return
+
+    ShoppingCartIngredient.objects.bulk_create(
+        [
+            ShoppingCartIngredient(user_id=user_id, ingredient_id=ing_id)
+            for user_id in users_ids
+            for ing_id, delta in deltas.items() if delta > 0
+        ],
+        ignore_conflicts=True,
+    )
+    totals = ShoppingCartIngredient.objects.filter(
+        user_id__in=users_ids, ingredient_id__in=deltas
+    )
+    totals.update(amount=Greatest(
+        F('amount') + Case(
+            *(
+                When(ingredient_id=ing_id, then=Value(delta))
+                for ing_id, delta in deltas.items()
+            ),
+            default=Value(0),
+            output_field=IntegerField(),
+        ),
+        0,
+    ))
+    totals.filter(amount=0).delete()
+
+
+def update_cart_totals(users_ids, recipes_ids, sign=1):
+    """
+    Прибавляет (sign=1) или вычитает (sign=-1) ингредиенты рецептов
+    recipes_ids из списков покупок пользователей users_ids.
+    """
+    if not users_ids or not recipes_ids:
+        return
+    amounts = IngredientAmount.objects.filter(
+        recipe_id__in=recipes_ids
+    ).values('ingredients_id').annotate(amount=Sum('amount')).order_by()
+    apply_cart_deltas(
+        users_ids,
+        {row['ingredients_id']: sign * row['amount'] for row in amounts},
+    )
+
+
+def remove_recipes_from_carts(recipes):
+    """
+    Убирает рецепты queryset recipes из всех списков покупок и вычитает
+    их ингредиенты из сумм каждого пользователя.
+    Количество запросов не зависит от количества рецептов
+    и пользователей. Счётчики in_carts_count не меняются:
+    функция вызывается перед удалением рецептов.
+    """
+    links = ShoppingCart.objects.filter(recipe__in=recipes)
+    removed = IngredientAmount.objects.filter(
+        recipe__in=recipes,
+        recipe__is_in_shopping_list=OuterRef('user_id'),
+        ingredients_id=OuterRef('ingredient_id'),
+    ).values('ingredients_id').annotate(
+        total=Sum('amount')
+    ).order_by().values('total')
+    totals = ShoppingCartIngredient.objects.filter(
+        user_id__in=links.values('user_id'),
+        ingredient_id__in=IngredientAmount.objects.filter(
+            recipe__in=recipes
+        ).values('ingredients_id'),
+    )
+    totals.update(amount=Greatest(
+        F('amount') - Coalesce(Subquery(removed), 0), 0
+    ))
+    totals.filter(amount=0).delete()
+    links.delete()
+
+
+def get_recipe_cart_users(recipe_id):
+    """
+    Возвращает id пользователей, у которых рецепт в списке покупок.
+    """
+    return list(ShoppingCart.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('user_id', flat=True))
+
+
+def calculate_cart_totals():
+    """
+    Считает суммы ингредиентов во всех списках покупок с нуля.
+    """
+    return IngredientAmount.objects.filter(
+        recipe__is_in_shopping_list__isnull=False
+    ).values(
+        user_id=F('recipe__is_in_shopping_list'),
+        ingredient_id=F('ingredients_id'),
+    ).annotate(total=Sum('amount')).order_by()
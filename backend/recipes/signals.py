@@ -0,0 +1,192 @@
+from django.db import connections
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from .counters import (Favorite, Follow, User, change_counters,
+                       get_m2m_counter_deltas)
+from .models import Ingredient, IngredientAmount, Recipe
+from .search import ingredient_index
+from .services import (ShoppingCart, apply_cart_deltas, get_recipe_cart_users,
+                       is_deletion_applied, update_cart_totals)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    """
+    Сбрасывает поисковый индекс ингредиентов при их изменении.
+    """
+    ingredient_index.invalidate()
+
+
+@receiver(m2m_changed, sender=ShoppingCart)
+def change_shopping_cart(instance, action, reverse, pk_set, **kwargs):
+    """
+    Пересчитывает суммы ингредиентов при добавлении рецептов в список
+    покупок и удалении из него.
+    Вычитаются только действительно существующие связи, поэтому
+    удаление обрабатывается до изменения таблицы.
+    """
+    if action not in ('post_add', 'pre_remove', 'pre_clear'):
+        return
+    if reverse:
+        links = ShoppingCart.objects.filter(user_id=instance.pk)
+        if action == 'pre_remove':
+            links = links.filter(recipe_id__in=pk_set)
+        users_ids = [instance.pk]
+        recipes_ids = (
+            pk_set if action == 'post_add'
+            else list(links.values_list('recipe_id', flat=True))
+        )
+    else:
+        links = ShoppingCart.objects.filter(recipe_id=instance.pk)
+        if action == 'pre_remove':
+            links = links.filter(user_id__in=pk_set)
+        recipes_ids = [instance.pk]
+        users_ids = (
+            pk_set if action == 'post_add'
+            else list(links.values_list('user_id', flat=True))
+        )
+    update_cart_totals(
+        users_ids, recipes_ids, 1 if action == 'post_add' else -1
+    )
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_carts(instance, **kwargs):
+    """
+    Убирает удаляемый рецепт из списков покупок,
+    чтобы вычесть его ингредиенты из сумм, если этого не делает
+    вызывающий код (deletion_applied).
+    """
+    if is_deletion_applied():
+        return
+    instance.is_in_shopping_list.clear()
+
+
+@receiver(pre_save, sender=IngredientAmount)
+def remember_ingredient_amount(instance, raw, **kwargs):
+    """
+    Запоминает сохранённые в БД ингредиент и количество
+    перед изменением IngredientAmount.
+    """
+    instance._cart_previous = None
+    if instance.pk and not raw:
+        instance._cart_previous = IngredientAmount.objects.filter(
+            pk=instance.pk
+        ).values_list('ingredients_id', 'amount').first()
+
+
+@receiver(post_save, sender=IngredientAmount)
+def change_ingredient_amount(instance, raw, **kwargs):
+    """
+    Переносит изменение количества ингредиента в рецепте
+    в списки покупок, содержащие этот рецепт.
+    При загрузке фикстур суммы пересчитываются командой
+    rebuild_cart_totals.
+    """
+    if raw:
+        return
+    users_ids = get_recipe_cart_users(instance.recipe_id)
+    if not users_ids:
+        return
+    deltas = {instance.ingredients_id: instance.amount}
+    previous = getattr(instance, '_cart_previous', None)
+    if previous:
+        ingredient_id, amount = previous
+        deltas[ingredient_id] = deltas.get(ingredient_id, 0) - amount
+    apply_cart_deltas(users_ids, deltas)
+
+
+@receiver(post_delete, sender=IngredientAmount)
+def delete_ingredient_amount(instance, **kwargs):
+    """
+    Вычитает удалённый из рецепта ингредиент из списков покупок,
+    если этого не делает вызывающий код (deletion_applied).
+    """
+    if is_deletion_applied():
+        return
+    apply_cart_deltas(
+        get_recipe_cart_users(instance.recipe_id),
+        {instance.ingredients_id: -instance.amount},
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def count_created_recipe(instance, created, raw, **kwargs):
+    """
+    Увеличивает счётчик рецептов автора.
+    """
+    if created and not raw:
+        change_counters(User, 'recipes_count', {instance.author_id: 1})
+
+
+@receiver(post_delete, sender=Recipe)
+def count_deleted_recipe(instance, **kwargs):
+    """
+    Уменьшает счётчик рецептов автора, если этого не делает
+    вызывающий код (deletion_applied).
+    """
+    if is_deletion_applied():
+        return
+    change_counters(User, 'recipes_count', {instance.author_id: -1})
+
+
+M2M_COUNTERS = {
+    Favorite: (Recipe.is_favorite.field, 'source', Recipe, 'favorites_count'),
+    ShoppingCart: (
+        Recipe.is_in_shopping_list.field, 'source', Recipe, 'in_carts_count'
+    ),
+    Follow: (User.follow.field, 'target', User, 'followers_count'),
+}
+
+
+@receiver(m2m_changed, sender=Favorite)
+@receiver(m2m_changed, sender=ShoppingCart)
+@receiver(m2m_changed, sender=Follow)
+def change_m2m_counters(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Обновляет счётчики избранного, списков покупок и подписчиков.
+    """
+    field, counted, model, counter = M2M_COUNTERS[sender]
+    change_counters(model, counter, get_m2m_counter_deltas(
+        field, counted, instance, action, reverse, pk_set
+    ))
+
+
+@receiver(pre_delete, sender=User)
+def remove_user_relations(instance, **kwargs):
+    """
+    Удаляет связи пользователя через менеджеры, чтобы обработчики
+    сигналов обновили счётчики и суммы в списках покупок
+    до каскадного удаления.
+    """
+    instance.follow.clear()
+    instance.favorites.clear()
+    instance.shopping_list.clear()
+
+
+def create_indexes(using, **kwargs):
+    """
+    Создаёт индексы, которые нельзя описать в Meta моделей.
+    Выполняется после миграций:
+    - составной индекс (tag_id, recipe_id) по таблице связи рецептов
+      и тэгов для фильтрации рецептов по тэгам;
+    - на PostgreSQL - триграммный GIN-индекс по названию ингредиента.
+    """
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    recipe_tags = quote(Recipe.tags.through._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS recipes_recipe_tags_tag_recipe '
+            f'ON {recipe_tags} (tag_id, recipe_id)'
+        )
+        if connection.vendor != 'postgresql':
+            return
+        table = quote(Ingredient._meta.db_table)
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_trgm '
+            f'ON {table} USING gin (name gin_trgm_ops)'
+        )
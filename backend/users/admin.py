@@ -11,6 +11,8 @@ class UserAdmin(admin.UserAdmin):
         'first_name',
         'last_name',
         'email',
+        'recipes_count',
+        'followers_count',
         'password',
     )
     fields = (